@@ -0,0 +1,158 @@
+import json
+
+import numpy as np
+
+from lib.audio.compressor import Compressor, MultibandCompressor, SimpleCompressor
+from lib.audio.crop import CropPlugin
+from lib.audio.equalizer import Equalizer, SimpleEqualizer
+from lib.audio.filter import FilterPlugin, FilterPresets, ResonantFilter, SimpleFilter
+from lib.audio.gain import GainPlugin
+from lib.audio.limiter import FastLimiter, Limiter, SimpleLimiter
+from lib.audio.pitch import PitchShiftPlugin
+from lib.audio.plugin import AudioPlugin
+from lib.audio.reverse import ReversePlugin
+from lib.audio.trim import TrimPlugin
+
+# Plugins that can be named in a chain description
+PLUGIN_TYPES = {
+    plugin.__name__: plugin for plugin in (
+        Compressor, SimpleCompressor, MultibandCompressor,
+        Equalizer, SimpleEqualizer,
+        FilterPlugin, ResonantFilter, SimpleFilter,
+        Limiter, FastLimiter, SimpleLimiter,
+        CropPlugin, ReversePlugin, GainPlugin, TrimPlugin, PitchShiftPlugin,
+    )
+}
+
+
+class PluginChain(AudioPlugin):
+    """
+    Runs several plugins back to back on a single float buffer.
+
+    Calling `process_sound` on each plugin in turn converts the sound to a
+    fresh int16 array, promotes it to float, clips, casts back and builds a
+    new Sound at every stage. A chain does the conversion once, passes the
+    float buffer from stage to stage and creates one Sound at the end.
+    """
+
+    def __init__(self, plugins, clip_between_stages=True):
+        """
+        Initialize the chain.
+
+        Args:
+            plugins (list): Plugins to run in order; None entries are skipped
+            clip_between_stages (bool): Clip to the int16 range after every stage,
+                so each stage sees the same levels as with separate Sounds
+        """
+        self.plugins = [plugin for plugin in plugins if plugin is not None]
+        self.clip_between_stages = clip_between_stages
+
+    def process_samples(self, samples, sample_rate):
+        """
+        Run every stage on a float sample array.
+
+        A failing stage is skipped (its input is passed on unchanged), just
+        like a plugin returns the original sound when `process_sound` fails.
+
+        Args:
+            samples (numpy.ndarray): Samples in int16 scale, mono or stereo
+            sample_rate (int): Sample rate in Hz
+
+        Returns:
+            numpy.ndarray: Processed samples
+        """
+        for plugin in self.plugins:
+            try:
+                processed = plugin.process_samples(samples, sample_rate)
+            except Exception as e:
+                print(f"{plugin.__class__.__name__} error: {e}")
+                continue
+
+            if self.clip_between_stages:
+                if np.shares_memory(processed, samples):
+                    # Stage returned a view of its input, don't clip the caller's buffer
+                    processed = np.clip(processed, -32768, 32767)
+                else:
+                    np.clip(processed, -32768, 32767, out=processed)
+            samples = processed
+
+        return samples
+
+    def reset_state(self):
+        """Reset the state of every stage."""
+        for plugin in self.plugins:
+            plugin.reset_state()
+
+
+def build_plugin(spec):
+    """
+    Create a plugin from its description.
+
+    Args:
+        spec (dict): {"plugin": class name, ...constructor arguments}, or
+            {"preset": FilterPresets method name}
+
+    Returns:
+        AudioPlugin: The configured plugin
+    """
+    spec = dict(spec)
+    if 'preset' in spec:
+        return getattr(FilterPresets, spec.pop('preset'))(**spec)
+
+    plugin_name = spec.pop('plugin', None)
+    if plugin_name not in PLUGIN_TYPES:
+        raise ValueError(f"Unknown plugin {plugin_name!r}, expected one of: {sorted(PLUGIN_TYPES)}")
+    return PLUGIN_TYPES[plugin_name](**spec)
+
+
+def compile_chain(stages, clip_between_stages=True):
+    """
+    Build an optimized PluginChain.
+
+    Stages that leave the audio unchanged are dropped and consecutive gain
+    stages are merged into one (without the clip between them).
+
+    Args:
+        stages (list): Plugins or plugin descriptions (see `build_plugin`)
+        clip_between_stages (bool): Passed on to the PluginChain
+
+    Returns:
+        PluginChain: The compiled chain
+    """
+    plugins = []
+    for stage in stages:
+        plugin = build_plugin(stage) if isinstance(stage, dict) else stage
+        if plugin is None or plugin.is_noop():
+            continue
+
+        if isinstance(plugin, GainPlugin) and plugins and isinstance(plugins[-1], GainPlugin):
+            merged = GainPlugin(plugins[-1].gain_db + plugin.gain_db)
+            plugins.pop()
+            if not merged.is_noop():
+                plugins.append(merged)
+            continue
+
+        plugins.append(plugin)
+
+    return PluginChain(plugins, clip_between_stages)
+
+
+def compile_chains(chain_specs, clip_between_stages=True):
+    """
+    Compile named chains, sharing one PluginChain between identical ones.
+
+    Args:
+        chain_specs (dict): Stage lists (see `compile_chain`) by chain name
+        clip_between_stages (bool): Passed on to every PluginChain
+
+    Returns:
+        dict: PluginChain by chain name; chains that compile to the same
+            stages are the same object, so their results can be shared
+    """
+    compiled = {}
+    chains = {}
+    for name, stages in chain_specs.items():
+        chain = compile_chain(stages, clip_between_stages)
+        description = json.dumps(chain.describe(), sort_keys=True)
+        chains[name] = compiled.setdefault(description, chain)
+    return chains
@@ -1,8 +1,12 @@
-import pygame
-import pygame.sndarray as sndarray
 import numpy as np
 
-from lib.audio.plugin import AudioPlugin
+from lib.audio.envelope import follow_envelope
+from lib.audio.filter import FilterPlugin
+from lib.audio.iir import StateSpaceFilter, biquad_state_space, parallel, series
+from lib.audio.plugin import AudioPlugin, as_columns, to_float
+
+# Quality factor of a Butterworth biquad
+BUTTERWORTH_Q = 1 / np.sqrt(2)
 
 
 class Compressor(AudioPlugin):
@@ -34,112 +38,73 @@ class Compressor(AudioPlugin):
         # Envelope follower state for each channel
         self.envelope_state = {}
 
-    def process_sound(self, sound):
+    def process_samples(self, samples, sample_rate):
         """
-        Apply compression to a Pygame Sound object.
+        Apply compression to a float sample array.
 
         Args:
-            sound (pygame.mixer.Sound): The sound to be compressed
+            samples (numpy.ndarray): Samples in int16 scale, mono or stereo
+            sample_rate (int): Sample rate in Hz
 
         Returns:
-            pygame.mixer.Sound: A new, compressed Sound object
+            numpy.ndarray: Compressed samples
         """
-        try:
-            # Convert sound to numpy array using sndarray (safer than raw bytes)
-            samples = sndarray.array(sound)
-
-            # Get sample rate
-            sample_rate = pygame.mixer.get_init()[0]
-            if sample_rate is None:
-                raise RuntimeError("Pygame mixer not initialized")
-
-            # Calculate time constants
-            attack_coeff = np.exp(-1.0 / (sample_rate * self.attack_ms / 1000.0))
-            release_coeff = np.exp(-1.0 / (sample_rate * self.release_ms / 1000.0))
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                # Mono audio
-                processed = self._compress_channel(samples, 0, attack_coeff, release_coeff)
-            else:
-                # Stereo audio - process each channel
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._compress_channel(
-                        samples[:, channel], channel, attack_coeff, release_coeff
-                    )
-
-            # Apply makeup gain
-            processed *= self.makeup_gain
-
-            # Convert back to original data type and create new sound
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Compressor error: {e}")
-            # Return original sound if processing fails
-            return sound
-
-    def _compress_channel(self, samples, channel_id, attack_coeff, release_coeff):
+        # Calculate time constants
+        attack_coeff = np.exp(-1.0 / (sample_rate * self.attack_ms / 1000.0))
+        release_coeff = np.exp(-1.0 / (sample_rate * self.release_ms / 1000.0))
+
+        # All channels at once, one envelope per column
+        audio = to_float(as_columns(samples))
+        processed = self._compress(audio, attack_coeff, release_coeff)
+
+        # Apply makeup gain
+        processed *= self.makeup_gain
+        return processed.reshape(samples.shape)
+
+    def _compress(self, audio, attack_coeff, release_coeff):
         """
-        Apply compression to a single channel.
+        Apply compression to every channel.
 
         Args:
-            samples: Input samples for one channel
-            channel_id: Channel identifier for state tracking
+            audio: Input samples shaped (frames, channels)
             attack_coeff: Pre-calculated attack coefficient
             release_coeff: Pre-calculated release coefficient
 
         Returns:
             numpy.ndarray: Compressed samples
         """
-        # Convert to float for processing
-        audio = samples.astype(np.float64)
-
-        # Initialize envelope state for this channel
-        if channel_id not in self.envelope_state:
-            self.envelope_state[channel_id] = 0.0
-
-        envelope = self.envelope_state[channel_id]
-        output = np.zeros_like(audio)
-
-        # Process each sample
-        for i in range(len(audio)):
-            # Get current sample amplitude
-            sample_amplitude = abs(audio[i]) / 32768.0  # Normalize to 0-1
-
-            # Envelope follower (peak detector)
-            if sample_amplitude > envelope:
-                # Attack: follow peaks quickly
-                envelope = sample_amplitude + (envelope - sample_amplitude) * attack_coeff
-            else:
-                # Release: decay slowly
-                envelope = sample_amplitude + (envelope - sample_amplitude) * release_coeff
-
-            # Calculate gain reduction
-            if envelope > self.threshold:
-                # Calculate compression
-                over_threshold = envelope - self.threshold
-                compressed_over = over_threshold / self.ratio
-                target_level = self.threshold + compressed_over
-                gain_reduction = target_level / envelope if envelope > 0 else 1.0
-            else:
-                # No compression needed
-                gain_reduction = 1.0
-
-            # Apply compression
-            output[i] = audio[i] * gain_reduction
+        channels = range(audio.shape[1])
+
+        # Envelope follower (peak detector): attack while the signal is above
+        # the envelope, release otherwise
+        amplitudes = np.abs(audio) / 32768.0  # Normalize to 0-1
+        envelope, state = follow_envelope(
+            amplitudes, [self.envelope_state.get(channel, 0.0) for channel in channels],
+            attack_coeff, release_coeff
+        )
 
         # Store envelope state for next call
-        self.envelope_state[channel_id] = envelope
+        for channel in channels:
+            self.envelope_state[channel] = float(state[channel])
 
-        return output
+        # Calculate gain reduction; the envelope is positive wherever it is
+        # above the threshold
+        gain_reduction = np.ones_like(envelope)
+        over = envelope > self.threshold
+        target_level = self.threshold + (envelope[over] - self.threshold) / self.ratio
+        gain_reduction[over] = target_level / envelope[over]
+
+        # Apply compression
+        return audio * gain_reduction
 
     def reset_state(self):
         """Reset compressor state (useful when switching between different sounds)."""
         self.envelope_state.clear()
 
+    def is_noop(self):
+        # A 1:1 ratio never changes the level
+        return self.ratio == 1 and self.makeup_gain == 1
+
 
 class SimpleCompressor(AudioPlugin):
     """
@@ -160,53 +125,41 @@ class SimpleCompressor(AudioPlugin):
         self.ratio = ratio
         self.makeup_gain = 10 ** (makeup_gain_db / 20.0)
 
-    def process_sound(self, sound):
+    def process_samples(self, samples, sample_rate):
         """Apply simple compression using vectorized operations."""
-        try:
-            samples = sndarray.array(sound)
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                processed = self._simple_compress(samples)
-            else:
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._simple_compress(samples[:, channel])
+        # Element-wise, so mono and stereo go through the same code
+        processed = self._simple_compress(samples)
 
-            # Apply makeup gain
-            processed *= self.makeup_gain
-
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Simple compressor error: {e}")
-            return sound
+        # Apply makeup gain
+        processed *= self.makeup_gain
+        return processed
 
     def _simple_compress(self, samples):
-        """Apply vectorized compression to one channel."""
-        audio = samples.astype(np.float64)
+        """Apply vectorized compression to any number of channels."""
+        audio = to_float(samples)
 
         # Calculate amplitudes
         amplitudes = np.abs(audio) / 32768.0
 
-        # Vectorized compression calculation
-        over_threshold = np.maximum(0, amplitudes - self.threshold)
-        compressed_over = over_threshold / self.ratio
-        target_levels = self.threshold + compressed_over
+        # Vectorized compression calculation, in one buffer:
+        # target level = threshold + (amplitude - threshold) / ratio above the threshold
+        gains = np.maximum(amplitudes, self.threshold)
+        gains -= self.threshold
+        gains /= self.ratio
+        gains += self.threshold
 
-        # Calculate gain reduction ratios
-        gain_reductions = np.where(amplitudes > 0,
-                                   target_levels / amplitudes,
-                                   1.0)
+        # Calculate gain reduction ratios (silent samples stay silent either way)
+        np.divide(gains, amplitudes, out=gains, where=amplitudes > 0)
 
         # Ensure no amplification above threshold
-        gain_reductions = np.minimum(gain_reductions, 1.0)
+        np.minimum(gains, 1.0, out=gains)
 
         # Apply compression
-        output = audio * gain_reductions
+        gains *= audio
+        return gains
 
-        return output
+    def is_noop(self):
+        return self.ratio == 1 and self.makeup_gain == 1
 
 
 class MultibandCompressor(AudioPlugin):
@@ -215,11 +168,17 @@ class MultibandCompressor(AudioPlugin):
     and applies different compression settings to each band.
     """
 
+    CROSSOVER_TYPES = ['fft', 'linkwitz_riley']
+
+    # Band edges in Hz
+    LOW_CROSSOVER = 300
+    HIGH_CROSSOVER = 3000
+
     def __init__(self,
                  low_threshold_db=-25.0, low_ratio=3.0,
                  mid_threshold_db=-20.0, mid_ratio=4.0,
                  high_threshold_db=-15.0, high_ratio=6.0,
-                 makeup_gain_db=3.0):
+                 makeup_gain_db=3.0, crossover='fft'):
         """
         Initialize multiband compressor.
 
@@ -231,66 +190,109 @@ class MultibandCompressor(AudioPlugin):
             high_threshold_db: High band threshold (> 3kHz)
             high_ratio: High band compression ratio
             makeup_gain_db: Overall makeup gain
+            crossover (str): 'fft' for a brick-wall split of the whole signal's
+                spectrum, 'linkwitz_riley' for 4th order time-domain crossovers
         """
         self.low_comp = SimpleCompressor(low_threshold_db, low_ratio, 0)
         self.mid_comp = SimpleCompressor(mid_threshold_db, mid_ratio, 0)
         self.high_comp = SimpleCompressor(high_threshold_db, high_ratio, 0)
         self.makeup_gain = 10 ** (makeup_gain_db / 20.0)
 
-    def process_sound(self, sound):
-        """Apply multiband compression."""
-        try:
-            samples = sndarray.array(sound)
-            sample_rate = pygame.mixer.get_init()[0]
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                processed = self._multiband_compress(samples, sample_rate)
-            else:
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._multiband_compress(samples[:, channel], sample_rate)
+        self.crossover = crossover.lower()
+        if self.crossover not in self.CROSSOVER_TYPES:
+            raise ValueError(f"Crossover must be one of: {self.CROSSOVER_TYPES}")
 
-            # Apply makeup gain
-            processed *= self.makeup_gain
+        # Linkwitz-Riley band filters (designed when first used)
+        self.band_filters = None
+        self.sample_rate = None
 
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
+    def process_samples(self, samples, sample_rate):
+        """Apply multiband compression."""
+        # Both crossovers run along the frame axis, so all channels go in one pass
+        processed = self._multiband_compress(samples, sample_rate)
 
-        except Exception as e:
-            print(f"Multiband compressor error: {e}")
-            return sound
+        # Apply makeup gain
+        processed *= self.makeup_gain
+        return processed
 
     def _multiband_compress(self, samples, sample_rate):
-        """Apply multiband compression to one channel using FFT."""
-        audio = samples.astype(np.float64)
+        """Split all channels into bands and compress each band."""
+        if self.crossover == 'linkwitz_riley':
+            low_audio, mid_audio, high_audio = self._split_linkwitz_riley(samples, sample_rate)
+        else:
+            low_audio, mid_audio, high_audio = self._split_fft(samples, sample_rate)
+
+        # Compress each band (kept in float) and sum the bands back together
+        output = self.low_comp._simple_compress(low_audio)
+        output += self.mid_comp._simple_compress(mid_audio)
+        output += self.high_comp._simple_compress(high_audio)
+        return output
+
+    def _split_fft(self, samples, sample_rate):
+        """
+        Split into bands with a single forward FFT.
+
+        The inverse FFT of the spectrum truncated at a band edge is the signal
+        below that edge, so two truncated inverse FFTs give every band without
+        masking copies of the spectrum.
+        """
+        audio = to_float(samples, copy=True)
 
         # FFT
-        fft = np.fft.rfft(audio)
+        fft = np.fft.rfft(audio, axis=0)
         freqs = np.fft.rfftfreq(len(audio), 1 / sample_rate)
 
-        # Split into bands
-        low_mask = freqs < 300
-        mid_mask = (freqs >= 300) & (freqs < 3000)
-        high_mask = freqs >= 3000
+        # First bin of the mid and high bands
+        mid_start, high_start = np.searchsorted(freqs, [self.LOW_CROSSOVER, self.HIGH_CROSSOVER])
 
-        # Process each band separately by converting back to time domain
-        low_fft = fft.copy()
-        low_fft[~low_mask] = 0
-        low_audio = np.fft.irfft(low_fft, len(audio))
+        low_audio = np.fft.irfft(fft[:mid_start], len(audio), axis=0)
+        high_audio = audio - np.fft.irfft(fft[:high_start], len(audio), axis=0)
+        del fft
 
-        mid_fft = fft.copy()
-        mid_fft[~mid_mask] = 0
-        mid_audio = np.fft.irfft(mid_fft, len(audio))
+        # The bands add up to the input, so the mid band is the remainder
+        mid_audio = audio
+        mid_audio -= low_audio
+        mid_audio -= high_audio
+        return low_audio, mid_audio, high_audio
 
-        high_fft = fft.copy()
-        high_fft[~high_mask] = 0
-        high_audio = np.fft.irfft(high_fft, len(audio))
-
-        # Compress each band
-        low_compressed = self.low_comp._simple_compress(low_audio.astype(np.int16))
-        mid_compressed = self.mid_comp._simple_compress(mid_audio.astype(np.int16))
-        high_compressed = self.high_comp._simple_compress(high_audio.astype(np.int16))
+    def _split_linkwitz_riley(self, samples, sample_rate):
+        """
+        Split into bands with 4th order Linkwitz-Riley crossovers.
 
-        # Sum the bands back together
-        return low_compressed + mid_compressed + high_compressed
+        Runs in the time domain, so long samples need no whole-signal FFT.
+        Every call is filtered from silence, like the FFT split.
+        """
+        if self.band_filters is None or self.sample_rate != sample_rate:
+            self.sample_rate = sample_rate
+            self.band_filters = self._design_crossover()
+
+        bands = []
+        for band_filter in self.band_filters:
+            band_filter.reset_state()
+            bands.append(band_filter.process(to_float(samples)))
+        return bands
+
+    def _design_crossover(self):
+        """Build the low, mid and high band filters."""
+        def linkwitz_riley(filter_type, cutoff_freq):
+            # Two identical Butterworth biquads in series
+            stage = FilterPlugin(filter_type, cutoff_freq, BUTTERWORTH_Q)
+            stage.sample_rate = self.sample_rate
+            stage._design_biquad_coefficients()
+            section = biquad_state_space(stage.b, stage.a)
+            return series(section, section)
+
+        low_lowpass = linkwitz_riley('lowpass', self.LOW_CROSSOVER)
+        low_highpass = linkwitz_riley('highpass', self.LOW_CROSSOVER)
+        high_lowpass = linkwitz_riley('lowpass', self.HIGH_CROSSOVER)
+        high_highpass = linkwitz_riley('highpass', self.HIGH_CROSSOVER)
+
+        # The low band also goes through the all-pass response of the upper
+        # crossover, so the three bands stay in phase and sum to a flat response
+        high_allpass = parallel(high_lowpass, high_highpass)
+
+        return [
+            StateSpaceFilter(*series(low_lowpass, high_allpass)),
+            StateSpaceFilter(*series(low_highpass, high_lowpass)),
+            StateSpaceFilter(*series(low_highpass, high_highpass)),
+        ]
@@ -1,7 +1,7 @@
-import pygame
+import numpy as np
 from pygame import sndarray
 
-from lib.audio.plugin import AudioPlugin
+from lib.audio.plugin import AudioPlugin, get_sample_rate, to_float
 
 
 class CropPlugin(AudioPlugin):
@@ -25,62 +25,69 @@ class CropPlugin(AudioPlugin):
         if self.start_ratio >= self.end_ratio:
             raise ValueError("start_ratio must be less than end_ratio")
 
+        # Fade ramps keyed by (fade_samples, channels)
+        self.fade_ramps = {}
+
     def process_sound(self, sound):
         """Crop the sound to specified portion."""
         try:
-            samples = sndarray.array(sound)
-            sample_rate = pygame.mixer.get_init()[0]
-
-            # Calculate crop points
-            total_samples = len(samples) if len(samples.shape) == 1 else len(samples[:, 0])
-            start_sample = int(total_samples * self.start_ratio)
-            end_sample = int(total_samples * self.end_ratio)
-
-            # Calculate fade samples
-            fade_samples = int(sample_rate * self.fade_ms / 1000.0)
-            fade_samples = min(fade_samples, (end_sample - start_sample) // 4)  # Max 25% of crop length
-
-            # Crop the audio
-            if len(samples.shape) == 1:
-                # Mono
-                cropped = samples[start_sample:end_sample].copy()
-            else:
-                # Stereo
-                cropped = samples[start_sample:end_sample, :].copy()
-
-            # Apply fade in/out to avoid clicks
+            # Reference the sound's own buffer; only the cropped part is copied
+            samples = sndarray.samples(sound)
+            start_sample, end_sample, fade_samples = self._crop_points(len(samples), get_sample_rate())
+
+            # Crop the audio; make_sound copies the slice into the new sound
+            cropped = sndarray.make_sound(samples[start_sample:end_sample])
+
+            # Apply fade in/out to avoid clicks, in place on the new sound's buffer
             if fade_samples > 0:
-                cropped = self._apply_fades(cropped, fade_samples)
+                self._apply_fades(sndarray.samples(cropped), fade_samples)
 
-            return sndarray.make_sound(cropped)
+            return cropped
 
         except Exception as e:
             print(f"Crop plugin error: {e}")
             return sound
 
+    def process_samples(self, samples, sample_rate):
+        """Crop a float sample array to the specified portion."""
+        start_sample, end_sample, fade_samples = self._crop_points(len(samples), sample_rate)
+
+        cropped = to_float(samples[start_sample:end_sample], copy=True)
+        if fade_samples > 0:
+            self._apply_fades(cropped, fade_samples)
+        return cropped
+
+    def _crop_points(self, total_samples, sample_rate):
+        """Return (start_sample, end_sample, fade_samples) for a sound of the given length."""
+        # Calculate crop points
+        start_sample = int(total_samples * self.start_ratio)
+        end_sample = int(total_samples * self.end_ratio)
+
+        # Calculate fade samples
+        fade_samples = int(sample_rate * self.fade_ms / 1000.0)
+        fade_samples = min(fade_samples, (end_sample - start_sample) // 4)  # Max 25% of crop length
+
+        return start_sample, end_sample, fade_samples
+
+    def _fade_ramps(self, fade_samples, channels):
+        """Fade in/out gain ramps, cached per (fade_samples, channels)."""
+        key = (fade_samples, channels)
+        if key not in self.fade_ramps:
+            fade_in = np.arange(fade_samples) / fade_samples
+            fade_out = np.arange(1, fade_samples + 1) / fade_samples
+            if channels:
+                fade_in = np.repeat(fade_in[:, None], channels, axis=1)
+                fade_out = np.repeat(fade_out[:, None], channels, axis=1)
+            self.fade_ramps[key] = (fade_in, fade_out)
+        return self.fade_ramps[key]
+
     def _apply_fades(self, samples, fade_samples):
         """Apply fade in and fade out to avoid clicks."""
-        if len(samples.shape) == 1:
-            # Mono
-            # Fade in
-            for i in range(fade_samples):
-                fade_gain = i / fade_samples
-                samples[i] = samples[i] * fade_gain
-
-            # Fade out
-            for i in range(fade_samples):
-                fade_gain = (fade_samples - i) / fade_samples
-                samples[-(i + 1)] = samples[-(i + 1)] * fade_gain
-        else:
-            # Stereo
-            # Fade in
-            for i in range(fade_samples):
-                fade_gain = i / fade_samples
-                samples[i, :] = samples[i, :] * fade_gain
-
-            # Fade out
-            for i in range(fade_samples):
-                fade_gain = (fade_samples - i) / fade_samples
-                samples[-(i + 1), :] = samples[-(i + 1), :] * fade_gain
-
-        return samples
\ No newline at end of file
+        channels = samples.shape[1] if len(samples.shape) > 1 else 0
+        fade_in, fade_out = self._fade_ramps(fade_samples, channels)
+
+        # Gain goes 0 -> (n-1)/n over the first samples and 1/n -> 1 over the last ones
+        samples[:fade_samples] = samples[:fade_samples] * fade_in
+        samples[-fade_samples:] = samples[-fade_samples:] * fade_out
+
+        return samples
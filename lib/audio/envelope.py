@@ -0,0 +1,172 @@
+import numpy as np
+
+# Smallest smoothing coefficient handled by the block solver. A coefficient of
+# zero (an instantaneous attack or release) is clamped to this value, which
+# changes the result by less than the coefficient itself.
+MIN_COEFF = 1e-12
+
+# Largest block solved in one go. Longer blocks waste work whenever the
+# attack/release guess for the block turns out to be wrong.
+MAX_BLOCK_SIZE = 2048
+
+# Decisions this close to a tie (relative to the level) are accepted either
+# way. Both branches give the same value there, and rounding in the block
+# solver would otherwise flip them back and forth forever.
+TIE_TOLERANCE = 1e-9
+
+# Keeps the running product of coefficients inside a block well above the
+# float64 underflow limit (about 1e-308).
+_MAX_LOG_DECAY = 575.0
+
+
+def follow_envelope(levels, state, rise_coeff, fall_coeff):
+    """
+    Run an attack/release one-pole envelope follower over a whole array.
+
+    This is a vectorized equivalent of the classic per-sample loop::
+
+        for i in range(len(levels)):
+            coeff = rise_coeff if levels[i] > state else fall_coeff
+            state = levels[i] + (state - levels[i]) * coeff
+            envelope[i] = state
+
+    The signal is solved in blocks. For each block the rising/falling
+    decision of every sample is guessed, the resulting time-varying linear
+    recurrence is solved in closed form with NumPy, and the guesses are
+    checked against the computed envelope. Everything before the first
+    wrong guess is exact and is committed; the remaining samples are solved
+    again with the corrected guesses. The output matches the per-sample loop
+    up to floating point rounding (relative error around 1e-9 at worst,
+    reached only where the level sits on the envelope).
+
+    A 2-D array of shape (frames, channels) is processed with one envelope
+    per column, all columns in the same pass. The recurrence is always
+    solved in float64 (the block solver needs its range); the envelope is
+    returned in the float type of `levels`.
+
+    Args:
+        levels: Array of detector levels (e.g. normalized amplitudes), (frames,) or (frames, channels)
+        state: Envelope value before the first sample, a float or one value per column
+        rise_coeff (float): Smoothing coefficient used while the level is above the envelope
+        fall_coeff (float): Smoothing coefficient used while the level is at or below the envelope
+
+    Returns:
+        tuple: (numpy.ndarray envelope shaped like levels, final envelope state -
+               a float for 1-D levels, one value per column otherwise)
+    """
+    levels = np.asarray(levels)
+    dtype = levels.dtype if levels.dtype.kind == 'f' else np.float64
+    columns = levels.astype(np.float64, copy=False)
+    columns = columns if columns.ndim == 2 else columns.reshape(-1, 1)
+    length, channels = columns.shape
+
+    previous = np.array(np.broadcast_to(np.asarray(state, dtype=np.float64), (channels,)))
+    envelope = np.empty_like(columns)
+
+    rise_coeff = max(float(rise_coeff), MIN_COEFF)
+    fall_coeff = max(float(fall_coeff), MIN_COEFF)
+    block_size = _block_size(min(rise_coeff, fall_coeff))
+
+    rising = np.empty(columns.shape, dtype=bool)
+    guessed = 0
+    start = 0
+
+    while start < length:
+        stop = min(start + block_size, length)
+
+        # Samples never seen before are guessed against the last exact value
+        if guessed < stop:
+            rising[guessed:stop] = columns[guessed:stop] > previous
+            guessed = stop
+
+        block = columns[start:stop]
+        coeffs = np.where(rising[start:stop], rise_coeff, fall_coeff)
+        trial = _solve_one_pole(block, coeffs, previous)
+
+        # Decisions implied by the trial envelope
+        before = np.empty_like(block)
+        before[0] = previous
+        before[1:] = trial[:-1]
+        implied = block > before
+
+        ambiguous = np.abs(block - before) <= TIE_TOLERANCE * (np.abs(block) + np.abs(before))
+        wrong = np.flatnonzero(((implied != rising[start:stop]) & ~ambiguous).any(axis=1))
+        if wrong.size == 0:
+            envelope[start:stop] = trial
+            previous = trial[-1]
+            start = stop
+            continue
+
+        # The trial is exact (in every column) up to the first wrong guess
+        first_wrong = wrong[0]
+        rising[start:stop] = implied
+        if first_wrong > 0:
+            envelope[start:start + first_wrong] = trial[:first_wrong]
+            previous = trial[first_wrong - 1]
+            start += first_wrong
+
+    envelope = envelope.astype(dtype, copy=False)
+    if levels.ndim == 1:
+        return envelope.reshape(-1), float(previous[0])
+    return envelope.reshape(levels.shape), previous
+
+
+def _block_size(min_coeff):
+    """Pick a block length whose coefficient product cannot underflow."""
+    decay = -np.log(min_coeff)
+    if decay <= 0:
+        return MAX_BLOCK_SIZE
+    return int(max(1, min(MAX_BLOCK_SIZE, _MAX_LOG_DECAY // decay)))
+
+
+def _solve_one_pole(levels, coeffs, state):
+    """
+    Solve y[n] = coeffs[n] * y[n-1] + (1 - coeffs[n]) * levels[n] in closed form.
+
+    With P[n] = coeffs[0] * ... * coeffs[n] the recurrence unrolls to
+    y[n] = P[n] * (state + sum_k (1 - coeffs[k]) * levels[k] / P[k]).
+    """
+    products = np.cumprod(coeffs, axis=0)
+    scaled = np.cumsum((1.0 - coeffs) * levels / products, axis=0)
+    return products * (state + scaled)
+
+
+def lookahead_peak(levels, window):
+    """
+    Compute the running maximum over the next `window` samples.
+
+    peak[i] = max(levels[i:i + window]), with the window truncated at the end
+    of the signal. Uses the van Herk/Gil-Werman scheme: the signal is cut
+    into blocks of `window` samples, and every window is covered by the
+    suffix maximum of one block plus the prefix maximum of the next, so the
+    cost is O(N) regardless of the window length.
+
+    Args:
+        levels: Array of non-negative levels, (frames,) or (frames, channels)
+        window (int): Lookahead length in samples
+
+    Returns:
+        numpy.ndarray: Peak level seen from each sample, shaped like levels
+    """
+    levels = np.asarray(levels)
+    if levels.dtype.kind != 'f':
+        levels = levels.astype(np.float64)
+    length = len(levels)
+    if window <= 0:
+        # Empty window, nothing to look at
+        return np.zeros_like(levels)
+    if window == 1 or length == 0:
+        return levels.copy()
+
+    # Zero padding is neutral because levels are non-negative
+    columns = levels if levels.ndim == 2 else levels.reshape(-1, 1)
+    blocks = -(-(length + window - 1) // window)
+    padded = np.zeros((blocks * window, columns.shape[1]), dtype=levels.dtype)
+    padded[:length] = columns
+    padded = padded.reshape(blocks, window, -1)
+
+    prefix = np.maximum.accumulate(padded, axis=1).reshape(blocks * window, -1)
+    suffix = np.maximum.accumulate(padded[:, ::-1], axis=1)[:, ::-1].reshape(blocks * window, -1)
+
+    peak = np.maximum(suffix[:length], prefix[window - 1:window - 1 + length])
+    return peak.reshape(levels.shape)
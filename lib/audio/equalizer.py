@@ -1,8 +1,7 @@
-import pygame
-import pygame.sndarray as sndarray
 import numpy as np
 
-from lib.audio.plugin import AudioPlugin
+from lib.audio.iir import SOSFilter
+from lib.audio.plugin import AudioPlugin, to_float
 
 
 class Equalizer(AudioPlugin):
@@ -27,21 +26,22 @@ class Equalizer(AudioPlugin):
         self.gain_db = gain_db
         self.b = None
         self.a = None
+        self.sample_rate = None
 
-        # Filter memory for each channel (stereo support)
-        self.x_history = {}  # Input history
-        self.y_history = {}  # Output history
+        # Biquad engine, keeps the filter memory for each channel (stereo support)
+        self.sos = None
 
-    def _design_filter(self):
+    def _design_filter(self, sample_rate):
         """
         Design a second-order peaking EQ filter.
 
         Uses a peaking filter design which is more suitable for EQ than bandpass.
+
+        Args:
+            sample_rate (int): Sample rate in Hz
         """
-        if self.a is None or self.b is None:
-            sample_rate = pygame.mixer.get_init()[0]
-            if sample_rate is None:
-                raise RuntimeError("Pygame mixer not initialized")
+        if self.a is None or self.b is None or self.sample_rate != sample_rate:
+            self.sample_rate = sample_rate
 
             # Convert to normalized frequency
             omega = 2 * np.pi * self.center_frequency / sample_rate
@@ -62,95 +62,38 @@ class Equalizer(AudioPlugin):
             # Normalize by a0
             self.b = np.array([b0, b1, b2]) / a0
             self.a = np.array([1.0, a1, a2]) / a0
+            self.sos = SOSFilter([(self.b, self.a)])
 
-    def process_sound(self, sound):
+    def process_samples(self, samples, sample_rate):
         """
-        Apply equalization to a Pygame Sound object.
+        Apply equalization to a float sample array.
 
         Args:
-            sound (pygame.mixer.Sound): The sound to be processed
+            samples (numpy.ndarray): Samples in int16 scale, mono or stereo
+            sample_rate (int): Sample rate in Hz
 
         Returns:
-            pygame.mixer.Sound: A new, equalized Sound object
-        """
-        try:
-            # Design filter if not already done
-            self._design_filter()
-
-            # Convert sound to numpy array using sndarray (safer than raw bytes)
-            samples = sndarray.array(sound)
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                # Mono audio
-                processed = self._filter_channel(samples, 0)
-            else:
-                # Stereo audio - process each channel independently
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._filter_channel(samples[:, channel], channel)
-
-            # Convert back to original data type and create new sound
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Equalizer error: {e}")
-            # Return original sound if processing fails
-            return sound
-
-    def _filter_channel(self, samples, channel_id):
+            numpy.ndarray: Equalized samples
         """
-        Apply IIR filter to a single channel with proper state management.
-
-        Args:
-            samples: Input samples for one channel
-            channel_id: Channel identifier for state tracking
-
-        Returns:
-            numpy.ndarray: Filtered samples
-        """
-        # Convert to float for processing
-        x = samples.astype(np.float64)
-        y = np.zeros_like(x)
-
-        # Initialize or get filter history for this channel
-        if channel_id not in self.x_history:
-            self.x_history[channel_id] = [0.0, 0.0]  # x[n-1], x[n-2]
-            self.y_history[channel_id] = [0.0, 0.0]  # y[n-1], y[n-2]
-
-        x_hist = self.x_history[channel_id]
-        y_hist = self.y_history[channel_id]
+        # Design filter if not already done
+        self._design_filter(sample_rate)
 
         # Apply IIR filter: y[n] = b0*x[n] + b1*x[n-1] + b2*x[n-2] - a1*y[n-1] - a2*y[n-2]
-        for n in range(len(x)):
-            # Current input
-            x_n = x[n]
-
-            # Calculate output
-            y[n] = (self.b[0] * x_n +
-                    self.b[1] * x_hist[0] +
-                    self.b[2] * x_hist[1] -
-                    self.a[1] * y_hist[0] -
-                    self.a[2] * y_hist[1])
-
-            # Update history
-            x_hist[1] = x_hist[0]  # x[n-2] = x[n-1]
-            x_hist[0] = x_n  # x[n-1] = x[n]
-
-            y_hist[1] = y_hist[0]  # y[n-2] = y[n-1]
-            y_hist[0] = y[n]  # y[n-1] = y[n]
-
-        # Store updated history
-        self.x_history[channel_id] = x_hist
-        self.y_history[channel_id] = y_hist
-
-        return y
+        # Every channel is filtered in the same pass, each with its own memory
+        return self.sos.process(to_float(samples))
 
     def reset_filter_state(self):
         """Reset filter memory (useful when switching between different sounds)."""
-        self.x_history.clear()
-        self.y_history.clear()
+        if self.sos is not None:
+            self.sos.reset_state()
+
+    def reset_state(self):
+        """Reset filter memory."""
+        self.reset_filter_state()
+
+    def is_noop(self):
+        # A peaking filter with 0 dB gain has identical numerator and denominator
+        return self.gain_db == 0
 
 
 class SimpleEqualizer(AudioPlugin):
@@ -172,34 +115,18 @@ class SimpleEqualizer(AudioPlugin):
         self.mid_gain = 10 ** (mid_gain_db / 20.0)
         self.high_gain = 10 ** (high_gain_db / 20.0)
 
-    def process_sound(self, sound):
+    def process_samples(self, samples, sample_rate):
         """Apply simple 3-band EQ using frequency domain processing."""
-        try:
-            samples = sndarray.array(sound)
-            sample_rate = pygame.mixer.get_init()[0]
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                processed = self._eq_channel(samples, sample_rate)
-            else:
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._eq_channel(samples[:, channel], sample_rate)
-
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Simple EQ error: {e}")
-            return sound
+        # The FFT runs along the frame axis, so all channels go in one pass
+        return self._eq_channel(samples, sample_rate)
 
     def _eq_channel(self, samples, sample_rate):
-        """Apply frequency domain EQ to one channel."""
+        """Apply frequency domain EQ to all channels."""
         # Convert to float
-        audio = samples.astype(np.float64)
+        audio = to_float(samples)
 
         # FFT
-        fft = np.fft.rfft(audio)
+        fft = np.fft.rfft(audio, axis=0)
         freqs = np.fft.rfftfreq(len(audio), 1 / sample_rate)
 
         # Apply gains to different frequency bands
@@ -209,7 +136,11 @@ class SimpleEqualizer(AudioPlugin):
         gains[freqs >= 3000] *= self.high_gain  # High frequencies
 
         # Apply gains and convert back
+        gains = gains.astype(audio.dtype).reshape((-1,) + (1,) * (fft.ndim - 1))
         fft_processed = fft * gains
-        processed = np.fft.irfft(fft_processed, len(audio))
+        processed = np.fft.irfft(fft_processed, len(audio), axis=0)
 
         return processed
+
+    def is_noop(self):
+        return self.low_gain == self.mid_gain == self.high_gain == 1
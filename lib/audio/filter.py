@@ -1,7 +1,7 @@
 import pygame
-import pygame.sndarray as sndarray
 import numpy as np
-from lib.audio.plugin import AudioPlugin
+from lib.audio.iir import SOSFilter, StateSpaceFilter, biquad_state_space, parallel
+from lib.audio.plugin import AudioPlugin, as_columns, to_float
 
 
 class FilterPlugin(AudioPlugin):
@@ -14,6 +14,8 @@ class FilterPlugin(AudioPlugin):
 
     FILTER_TYPES = ['lowpass', 'highpass', 'bandpass', 'bandstop']
 
+    DERIVED_ATTRIBUTES = AudioPlugin.DERIVED_ATTRIBUTES + ('stages',)
+
     def __init__(self, filter_type='lowpass', cutoff_freq=1000, q_factor=0.707,
                  high_cutoff=None):
         """
@@ -35,8 +37,9 @@ class FilterPlugin(AudioPlugin):
         self.a = None
         self.sample_rate = None
 
-        # Filter memory for each channel (biquad sections)
-        self.filter_states = {}
+        # Biquad engine, keeps the filter memory for each channel
+        self.engine = None
+        self.stages = None
 
         if self.filter_type not in self.FILTER_TYPES:
             raise ValueError(f"Filter type must be one of: {self.FILTER_TYPES}")
@@ -134,115 +137,48 @@ class FilterPlugin(AudioPlugin):
             self._design_biquad_coefficients()
             self.stages = None
 
-    def process_sound(self, sound):
-        """
-        Apply filtering to a Pygame Sound object.
+        self.engine = self._build_engine()
 
-        Args:
-            sound (pygame.mixer.Sound): The sound to be processed
+    def _build_engine(self):
+        """Merge the designed stages into a single block-processing engine."""
+        if self.stages is None:
+            return SOSFilter([(self.b, self.a)])
 
-        Returns:
-            pygame.mixer.Sound: A new, filtered Sound object
-        """
-        try:
-            # Design filter if not already done
-            if self.b is None or self.a is None:
-                self._design_multi_stage_filter()
-
-            # Convert sound to numpy array
-            samples = sndarray.array(sound)
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                # Mono audio
-                processed = self._filter_channel(samples, 0)
-            else:
-                # Stereo audio - process each channel independently
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._filter_channel(samples[:, channel], channel)
-
-            # Convert back to original data type and create new sound
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
+        if self.filter_type == 'bandpass':
+            # Cascade: highpass then lowpass
+            return SOSFilter([(stage.b, stage.a) for stage in self.stages])
 
-        except Exception as e:
-            print(f"Filter processing error: {e}")
-            # Return original sound if processing fails
-            return sound
+        # Bandstop - parallel: lowpass + highpass, mixed with equal weights
+        low, high = (biquad_state_space(stage.b, stage.a) for stage in self.stages)
+        return StateSpaceFilter(*parallel(low, high, 0.5, 0.5))
 
-    def _filter_channel(self, samples, channel_id):
+    def process_samples(self, samples, sample_rate):
         """
-        Apply biquad filter to a single channel.
+        Apply filtering to a float sample array.
 
         Args:
-            samples: Input samples for one channel
-            channel_id: Channel identifier for state tracking
+            samples (numpy.ndarray): Samples in int16 scale, mono or stereo
+            sample_rate (int): Sample rate in Hz
 
         Returns:
             numpy.ndarray: Filtered samples
         """
-        if self.stages is not None:
-            # Multi-stage filtering
-            return self._multi_stage_filter_channel(samples, channel_id)
-        else:
-            # Single biquad filter
-            return self._biquad_filter_channel(samples, channel_id)
-
-    def _biquad_filter_channel(self, samples, channel_id):
-        """Apply single biquad filter to channel."""
-        # Convert to float for processing
-        x = samples.astype(np.float64)
-        y = np.zeros_like(x)
-
-        # Initialize or get filter state for this channel
-        if channel_id not in self.filter_states:
-            self.filter_states[channel_id] = {
-                'x': [0.0, 0.0],  # x[n-1], x[n-2]
-                'y': [0.0, 0.0]  # y[n-1], y[n-2]
-            }
+        # Design filter if not already done
+        if self.engine is None or self.sample_rate != sample_rate:
+            self.sample_rate = sample_rate
+            self._design_multi_stage_filter()
 
-        state = self.filter_states[channel_id]
-
-        # Apply biquad filter: y[n] = b0*x[n] + b1*x[n-1] + b2*x[n-2] - a1*y[n-1] - a2*y[n-2]
-        for n in range(len(x)):
-            x_n = x[n]
-
-            y[n] = (self.b[0] * x_n +
-                    self.b[1] * state['x'][0] +
-                    self.b[2] * state['x'][1] -
-                    self.a[1] * state['y'][0] -
-                    self.a[2] * state['y'][1])
-
-            # Update state
-            state['x'][1] = state['x'][0]
-            state['x'][0] = x_n
-            state['y'][1] = state['y'][0]
-            state['y'][0] = y[n]
-
-        return y
-
-    def _multi_stage_filter_channel(self, samples, channel_id):
-        """Apply multi-stage filtering."""
-        if self.filter_type == 'bandpass':
-            # Cascade: highpass then lowpass
-            temp = self.stages[0]._biquad_filter_channel(samples, f"{channel_id}_stage1")
-            return self.stages[1]._biquad_filter_channel(temp, f"{channel_id}_stage2")
-
-        elif self.filter_type == 'bandstop':
-            # Parallel: lowpass + highpass, then mix
-            low = self.stages[0]._biquad_filter_channel(samples, f"{channel_id}_low")
-            high = self.stages[1]._biquad_filter_channel(samples, f"{channel_id}_high")
-            return (low + high) * 0.5  # Mix with equal weights
-
-        return samples
+        # Every channel goes through the engine in the same pass
+        return self.engine.process(to_float(samples))
 
     def reset_filter_state(self):
         """Reset filter memory."""
-        self.filter_states.clear()
-        if hasattr(self, 'stages') and self.stages:
-            for stage in self.stages:
-                stage.reset_filter_state()
+        if self.engine is not None:
+            self.engine.reset_state()
+
+    def reset_state(self):
+        """Reset filter memory."""
+        self.reset_filter_state()
 
     def update_parameters(self, **kwargs):
         """Update filter parameters and force recalculation."""
@@ -258,7 +194,7 @@ class FilterPlugin(AudioPlugin):
         # Force recalculation
         self.b = None
         self.a = None
-        self.reset_filter_state()
+        self.engine = None
 
 
 class ResonantFilter(AudioPlugin):
@@ -267,6 +203,8 @@ class ResonantFilter(AudioPlugin):
     Great for electronic music effects without external dependencies.
     """
 
+    DERIVED_ATTRIBUTES = AudioPlugin.DERIVED_ATTRIBUTES + ('engine_coefficients',)
+
     def __init__(self, cutoff_freq=1000, resonance=1.0, filter_type='lowpass'):
         """
         Initialize resonant filter.
@@ -283,79 +221,120 @@ class ResonantFilter(AudioPlugin):
         # Filter state variables for each channel
         self.filter_states = {}
 
-    def process_sound(self, sound):
-        """Apply resonant filtering."""
-        try:
-            samples = sndarray.array(sound)
-            sample_rate = pygame.mixer.get_init()[0]
+        # Block engine for the current coefficients, built on first use
+        self.engine = None
+        self.engine_coefficients = None
 
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                processed = self._resonant_filter_channel(samples, 0, sample_rate)
-            else:
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._resonant_filter_channel(
-                        samples[:, channel], channel, sample_rate
-                    )
-
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Resonant filter error: {e}")
-            return sound
+    def process_samples(self, samples, sample_rate):
+        """Apply resonant filtering to all channels at once."""
+        x = to_float(as_columns(samples))
+        y = np.zeros_like(x)
+        if len(x) == 0:
+            return y.reshape(samples.shape)
 
-    def _resonant_filter_channel(self, samples, channel_id, sample_rate):
-        """Apply state variable filter to channel."""
         # Initialize state variables
-        if channel_id not in self.filter_states:
-            self.filter_states[channel_id] = {
-                'low': 0.0,
-                'band': 0.0,
-                'high': 0.0
-            }
-
-        state = self.filter_states[channel_id]
-
-        # Convert to float
-        x = samples.astype(np.float64)
-        y = np.zeros_like(x)
+        states = [self.filter_states.setdefault(channel, {'low': 0.0, 'band': 0.0, 'high': 0.0})
+                  for channel in range(x.shape[1])]
 
         # Calculate filter coefficients
+        f, q = self._coefficients(sample_rate)
+        if self.engine_coefficients != (f, q, self.filter_type):
+            self.engine = self._build_engine(f, q)
+            self.engine_coefficients = (f, q, self.filter_type)
+
+        if self.engine is None:
+            for channel, state in enumerate(states):
+                y[:, channel] = self._resonant_filter_loop(x[:, channel], state, f, q)
+            return y.reshape(samples.shape)
+
+        # Stable filter: run all but the last sample through the block engine
+        # (its state never gets near the clipping limits)...
+        for channel, state in enumerate(states):
+            self.engine.states[channel] = np.array([state['low'], state['band']])
+        y[:-1] = self.engine.process(x[:-1])
+        for channel, state in enumerate(states):
+            state['low'], state['band'] = (float(v) for v in self.engine.states.pop(channel))
+
+        # ...and the last one through the filter equations, so 'high' is up to date too
+        for channel, state in enumerate(states):
+            y[-1:, channel] = self._resonant_filter_loop(x[-1:, channel], state, f, q)
+        return y.reshape(samples.shape)
+
+    def _coefficients(self, sample_rate):
+        """Frequency and damping coefficients of the state variable filter."""
         # Frequency coefficient (0 to 1)
-        f = np.clip(2.0 * np.sin(np.pi * self.cutoff_freq / sample_rate), 0.0, 1.0)
+        f = float(np.clip(2.0 * np.sin(np.pi * self.cutoff_freq / sample_rate), 0.0, 1.0))
         # Resonance coefficient
         q = 1.0 / self.resonance
+        return f, q
+
+    def _build_engine(self, f, q):
+        """
+        Express one step of the state variable filter as a linear system.
+
+        With the state s = [low, band], a step is
+        low' = low + f*band, high = x - low' - q*band, band' = band + f*high,
+        so every output is a linear function of s and x and the block
+        engine can run the filter without a per-sample loop.
+        """
+        A = [[1.0, f],
+             [-f, 1.0 - f * (f + q)]]
+        B = [0.0, f]
+
+        if self.filter_type == 'lowpass':
+            C, D = [1.0, f], 0.0
+        elif self.filter_type == 'highpass':
+            C, D = [-1.0, -(f + q)], 1.0
+        elif self.filter_type == 'bandpass':
+            C, D = [-f, 1.0 - f * (f + q)], f
+        else:
+            C, D = [0.0, 0.0], 1.0  # Bypass
+
+        engine = StateSpaceFilter(A, B, C, D)
+
+        # Resonance settings with f*q close to 2 make the recursion blow up;
+        # those keep going through the clipped per-sample loop
+        if np.max(np.abs(np.linalg.eigvals(engine.A))) >= 1.0:
+            return None
+        return engine
+
+    def _resonant_filter_loop(self, x, state, f, q):
+        """Per-sample state variable filter with clipping against instability."""
+        y = np.zeros_like(x)
+        low, band, high = state['low'], state['band'], state['high']
 
-        # Apply state variable filter
         for i in range(len(x)):
             # State variable filter equations
-            state['low'] += f * state['band']
-            state['high'] = x[i] - state['low'] - q * state['band']
-            state['band'] += f * state['high']
+            low += f * band
+            high = x[i] - low - q * band
+            band += f * high
 
             # Prevent numerical instability
-            state['low'] = np.clip(state['low'], -1e6, 1e6)
-            state['band'] = np.clip(state['band'], -1e6, 1e6)
-            state['high'] = np.clip(state['high'], -1e6, 1e6)
+            low = min(max(low, -1e6), 1e6)
+            band = min(max(band, -1e6), 1e6)
+            high = min(max(high, -1e6), 1e6)
 
             # Select output
             if self.filter_type == 'lowpass':
-                y[i] = state['low']
+                y[i] = low
             elif self.filter_type == 'highpass':
-                y[i] = state['high']
+                y[i] = high
             elif self.filter_type == 'bandpass':
-                y[i] = state['band']
+                y[i] = band
             else:
                 y[i] = x[i]  # Bypass
 
+        state['low'], state['band'], state['high'] = float(low), float(band), float(high)
         return y
 
     def reset_filter_state(self):
         """Reset filter states."""
         self.filter_states.clear()
 
+    def reset_state(self):
+        """Reset filter states."""
+        self.reset_filter_state()
+
 
 class SimpleFilter(AudioPlugin):
     """
@@ -363,6 +342,8 @@ class SimpleFilter(AudioPlugin):
     Minimal CPU usage, good for real-time applications.
     """
 
+    DERIVED_ATTRIBUTES = AudioPlugin.DERIVED_ATTRIBUTES + ('engine_alpha',)
+
     def __init__(self, filter_type='lowpass', cutoff_freq=1000, mix=1.0):
         """
         Initialize simple filter.
@@ -379,65 +360,55 @@ class SimpleFilter(AudioPlugin):
         # Filter memory
         self.filter_states = {}
 
-    def process_sound(self, sound):
-        """Apply simple filtering."""
-        try:
-            samples = sndarray.array(sound)
-            sample_rate = pygame.mixer.get_init()[0]
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                processed = self._simple_filter_channel(samples, 0, sample_rate)
-            else:
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._simple_filter_channel(
-                        samples[:, channel], channel, sample_rate
-                    )
-
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Simple filter error: {e}")
-            return sound
-
-    def _simple_filter_channel(self, samples, channel_id, sample_rate):
-        """Apply simple first-order filter."""
-        if channel_id not in self.filter_states:
-            self.filter_states[channel_id] = 0.0
-
-        # Convert to float
-        x = samples.astype(np.float64)
-        y = np.zeros_like(x)
+        # One-pole engine for the current smoothing coefficient
+        self.engine = None
+        self.engine_alpha = None
 
+    def process_samples(self, samples, sample_rate):
+        """Apply simple filtering to all channels at once."""
         # Calculate smoothing coefficient
         rc = 1.0 / (2 * np.pi * self.cutoff_freq)
         dt = 1.0 / sample_rate
         alpha = dt / (rc + dt)
 
-        state = self.filter_states[channel_id]
+        if self.engine_alpha != alpha:
+            self.engine = self._build_engine(alpha)
+            self.engine_alpha = alpha
 
-        for i in range(len(x)):
-            if self.filter_type == 'lowpass':
-                # Low-pass: smooth the signal
-                state = state + alpha * (x[i] - state)
-                filtered = state
-            else:  # highpass
-                # High-pass: input - lowpass
-                state = state + alpha * (x[i] - state)
-                filtered = x[i] - state
-
-            # Apply mix
-            y[i] = (1.0 - self.mix) * x[i] + self.mix * filtered
-
-        self.filter_states[channel_id] = state
+        channels = as_columns(samples).shape[1]
+        for channel in range(channels):
+            self.engine.states[channel] = np.array([self.filter_states.get(channel, 0.0)])
+        y = self.engine.process(to_float(samples))
+        for channel in range(channels):
+            self.filter_states[channel] = float(self.engine.states.pop(channel)[0])
         return y
 
+    def _build_engine(self, alpha):
+        """
+        Express the RC filter as a one-pole linear recurrence.
+
+        The smoothed state follows state[n] = (1 - alpha) * state[n-1] + alpha * x[n];
+        the low-pass output is that state, the high-pass output is x minus it,
+        and the dry/wet mix is folded into the output coefficients.
+        """
+        if self.filter_type == 'lowpass':
+            # filtered = state[n]
+            C, D = 1.0 - alpha, alpha
+        else:  # highpass
+            # filtered = x[n] - state[n]
+            C, D = -(1.0 - alpha), 1.0 - alpha
+
+        return StateSpaceFilter([[1.0 - alpha]], [alpha],
+                                [self.mix * C], (1.0 - self.mix) + self.mix * D)
+
     def reset_filter_state(self):
         """Reset filter state."""
         self.filter_states.clear()
 
+    def reset_state(self):
+        """Reset filter state."""
+        self.reset_filter_state()
+
 
 # Preset configurations
 class FilterPresets:
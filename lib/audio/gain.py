@@ -0,0 +1,24 @@
+from lib.audio.plugin import AudioPlugin, to_float
+
+
+class GainPlugin(AudioPlugin):
+    """
+    Plugin to change the level of audio by a fixed amount.
+    """
+
+    def __init__(self, gain_db=0.0):
+        """
+        Initialize gain plugin.
+
+        Args:
+            gain_db (float): Gain in decibels (positive boost, negative cut)
+        """
+        self.gain_db = gain_db
+        self.gain = 10 ** (gain_db / 20.0)
+
+    def process_samples(self, samples, sample_rate):
+        """Scale the samples by the gain."""
+        return to_float(samples) * self.gain
+
+    def is_noop(self):
+        return self.gain_db == 0
@@ -1,8 +1,7 @@
-import pygame
-import pygame.sndarray as sndarray
 import numpy as np
 
-from lib.audio.plugin import AudioPlugin
+from lib.audio.envelope import follow_envelope, lookahead_peak
+from lib.audio.plugin import AudioPlugin, as_columns, to_float
 
 
 class Limiter(AudioPlugin):
@@ -29,108 +28,54 @@ class Limiter(AudioPlugin):
         self.release_ms = release_ms
         self.lookahead_ms = lookahead_ms
 
-        # Internal state for smooth gain reduction
-        self.envelope = 1.0
+        # Internal state for smooth gain reduction, one envelope per channel
+        self.envelope_state = {}
 
-    def process_sound(self, sound):
+    def process_samples(self, samples, sample_rate):
         """
-        Apply limiting to a Pygame Sound object.
+        Apply limiting to a float sample array.
 
         Args:
-            sound (pygame.mixer.Sound): The sound to be limited
+            samples (numpy.ndarray): Samples in int16 scale, mono or stereo
+            sample_rate (int): Sample rate in Hz
 
         Returns:
-            pygame.mixer.Sound: A new, limited Sound object
+            numpy.ndarray: Limited samples
         """
-        try:
-            # Convert sound to numpy array using sndarray (safer than raw bytes)
-            samples = sndarray.array(sound)
-
-            # Get mixer settings
-            sample_rate = pygame.mixer.get_init()[0]
-            if sample_rate is None:
-                raise RuntimeError("Pygame mixer not initialized")
-
-            # Calculate time constants in samples
-            attack_samples = max(1, int(sample_rate * (self.attack_ms / 1000.0)))
-            release_samples = max(1, int(sample_rate * (self.release_ms / 1000.0)))
-            lookahead_samples = int(sample_rate * (self.lookahead_ms / 1000.0))
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                # Mono audio
-                processed = self._limit_channel(samples, attack_samples, release_samples, lookahead_samples)
-            else:
-                # Stereo audio - process each channel
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._limit_channel(
-                        samples[:, channel], attack_samples, release_samples, lookahead_samples
-                    )
-
-            # Convert back to original data type and create new sound
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Limiter error: {e}")
-            # Return original sound if processing fails
-            return sound
-
-    def _limit_channel(self, samples, attack_samples, release_samples, lookahead_samples):
-        """
-        Apply limiting to a single channel.
-
-        Args:
-            samples: Input samples for one channel
-            attack_samples: Attack time in samples
-            release_samples: Release time in samples
-            lookahead_samples: Lookahead time in samples
+        # Calculate time constants in samples
+        attack_samples = max(1, int(sample_rate * (self.attack_ms / 1000.0)))
+        release_samples = max(1, int(sample_rate * (self.release_ms / 1000.0)))
+        lookahead_samples = int(sample_rate * (self.lookahead_ms / 1000.0))
 
-        Returns:
-            numpy.ndarray: Processed samples
-        """
         # Convert to float for processing
-        audio = samples.astype(np.float64)
-        length = len(audio)
-
-        # Create output buffer
-        output = np.zeros_like(audio)
+        audio = to_float(as_columns(samples))
 
-        # Initialize envelope follower
-        envelope = self.envelope
+        # Look ahead to find peak in upcoming samples
+        amplitudes = np.abs(audio) / 32768.0  # Normalize to 0-1 range
+        peak_amplitude = lookahead_peak(amplitudes, lookahead_samples)
 
-        # Process with lookahead
-        for i in range(length):
-            # Look ahead to find peak in upcoming samples
-            lookahead_end = min(i + lookahead_samples, length)
-            peak_amplitude = 0.0
+        # Calculate required gain reduction
+        target_gain = np.ones_like(peak_amplitude)
+        over = peak_amplitude > self.threshold
+        target_gain[over] = self.threshold / peak_amplitude[over]
 
-            for j in range(i, lookahead_end):
-                amplitude = abs(audio[j]) / 32768.0  # Normalize to 0-1 range
-                peak_amplitude = max(peak_amplitude, amplitude)
+        # Smooth gain changes: attack while the gain has to drop,
+        # release while it recovers
+        channels = range(audio.shape[1])
+        envelope, state = follow_envelope(
+            target_gain, [self.envelope_state.get(channel, 1.0) for channel in channels],
+            rise_coeff=np.exp(-1.0 / release_samples),
+            fall_coeff=np.exp(-1.0 / attack_samples)
+        )
+        for channel in channels:
+            self.envelope_state[channel] = float(state[channel])
 
-            # Calculate required gain reduction
-            if peak_amplitude > self.threshold:
-                target_gain = self.threshold / peak_amplitude
-            else:
-                target_gain = 1.0
+        # Apply gain reduction
+        return (audio * envelope).reshape(samples.shape)
 
-            # Smooth gain changes
-            if target_gain < envelope:
-                # Attack phase (gain reduction)
-                envelope = target_gain + (envelope - target_gain) * np.exp(-1.0 / attack_samples)
-            else:
-                # Release phase (gain recovery)
-                envelope = target_gain + (envelope - target_gain) * np.exp(-1.0 / release_samples)
-
-            # Apply gain reduction
-            output[i] = audio[i] * envelope
-
-        # Store envelope state for next call
-        self.envelope = envelope
-
-        return output
+    def reset_state(self):
+        """Reset the gain envelopes (useful when switching between different sounds)."""
+        self.envelope_state.clear()
 
 
 class FastLimiter(AudioPlugin):
@@ -151,29 +96,9 @@ class FastLimiter(AudioPlugin):
         self.release_factor = release_factor
         self.gain = 0.02
 
-    def process_sound(self, sound):
-        """Apply ultra-fast limiting using vectorized operations."""
-        try:
-            samples = sndarray.array(sound)
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                processed = self._fast_limit(samples)
-            else:
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._fast_limit(samples[:, channel])
-
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Fast limiter error: {e}")
-            return sound
-
-    def _fast_limit(self, samples):
+    def process_samples(self, samples, sample_rate):
         """Apply vectorized limiting - MUCH faster but less precise."""
-        audio = samples.astype(np.float64)
+        audio = to_float(samples)
 
         # Vectorized amplitude calculation
         amplitudes = np.abs(audio) / 32768.0
@@ -205,48 +130,54 @@ class SimpleLimiter(AudioPlugin):
         """
         self.threshold = 10 ** (threshold_db / 20.0)
         self.release_factor = release_factor
-        self.gain = 1.0
-
-    def process_sound(self, sound):
-        """Apply simple limiting to a Pygame Sound object."""
-        try:
-            samples = sndarray.array(sound)
-
-            # Handle both mono and stereo
-            if len(samples.shape) == 1:
-                processed = self._simple_limit(samples)
-            else:
-                processed = np.zeros_like(samples, dtype=np.float64)
-                for channel in range(samples.shape[1]):
-                    processed[:, channel] = self._simple_limit(samples[:, channel])
-
-            processed = np.clip(processed, -32768, 32767).astype(samples.dtype)
-            return sndarray.make_sound(processed)
-
-        except Exception as e:
-            print(f"Simple limiter error: {e}")
-            return sound
-
-    def _simple_limit(self, samples):
-        """Apply simple limiting to one channel."""
-        audio = samples.astype(np.float64)
+
+        # Current gain of each channel
+        self.gain_state = {}
+
+    def process_samples(self, samples, sample_rate):
+        """
+        Apply simple limiting to all channels at once.
+
+        The per-sample rule is: above the threshold the gain drops to
+        min(gain, threshold / amplitude), below it the gain recovers with
+        gain * release + (1 - release). Written for the gain deficit
+        d = 1 - gain this becomes d = max(d, 1 - threshold / amplitude) and
+        d = d * release, i.e. log(d) is a max-plus recurrence:
+
+            log d[n] = C[n] + max(log d[-1], max over k <= n of (w[k] - C[k]))
+
+        where C is the cumulative sum of log(release) over the recovering
+        samples and w = log(1 - threshold / amplitude) on the limited ones.
+        That is one cumsum and one running maximum along each channel,
+        done in float64 whatever the sample precision.
+        """
+        audio = to_float(as_columns(samples))
+        if len(audio) == 0:
+            return audio.reshape(samples.shape)
+        channels = range(audio.shape[1])
+
         amplitudes = np.abs(audio) / 32768.0
+        over = amplitudes > self.threshold
+
+        with np.errstate(divide='ignore'):
+            # Deficit floor on limited samples, -inf (no floor) elsewhere
+            floor = np.full(audio.shape, -np.inf)
+            floor[over] = np.log(1.0 - self.threshold / amplitudes[over])
 
-        # Vectorized gain calculation with envelope following
-        gains = np.ones(len(audio))
-        current_gain = self.gain
+            # Deficit decay on recovering samples
+            decay = np.where(over, 0.0, np.log(max(self.release_factor, 1e-300)))
+            decay = np.cumsum(decay, axis=0)
 
-        for i in range(len(audio)):
-            amplitude = amplitudes[i]
+            gain = np.array([self.gain_state.get(channel, 1.0) for channel in channels])
+            initial = np.log(np.maximum(1.0 - gain, 0.0))
 
-            if amplitude > self.threshold:
-                required_gain = self.threshold / amplitude
-                current_gain = min(current_gain, required_gain)
-            else:
-                current_gain = current_gain * self.release_factor + (1.0 - self.release_factor)
-                current_gain = min(current_gain, 1.0)
+        log_deficit = decay + np.maximum(initial, np.maximum.accumulate(floor - decay, axis=0))
+        gains = 1.0 - np.exp(log_deficit)
 
-            gains[i] = current_gain
+        for channel in channels:
+            self.gain_state[channel] = float(gains[-1, channel])
+        return (audio * gains.astype(audio.dtype)).reshape(samples.shape)
 
-        self.gain = current_gain
-        return audio * gains
\ No newline at end of file
+    def reset_state(self):
+        """Reset the gain of every channel."""
+        self.gain_state.clear()
@@ -0,0 +1,45 @@
+import numpy as np
+
+from lib.audio.plugin import AudioPlugin, as_columns, to_float
+
+
+class PitchShiftPlugin(AudioPlugin):
+    """
+    Plugin to change the pitch of audio by resampling it.
+
+    Like a tape played faster or slower, the duration changes with the
+    pitch: a shift up by an octave halves the length. The new samples are
+    linearly interpolated between the original ones for all channels at once.
+    """
+
+    DERIVED_ATTRIBUTES = AudioPlugin.DERIVED_ATTRIBUTES + ('ratio',)
+
+    def __init__(self, semitones=0.0):
+        """
+        Initialize pitch shift plugin.
+
+        Args:
+            semitones (float): Shift in semitones (positive up, negative down)
+        """
+        self.semitones = semitones
+        self.ratio = 2 ** (semitones / 12.0)
+
+    def process_samples(self, samples, sample_rate):
+        """Resample a float sample array to the shifted pitch."""
+        samples = to_float(samples)
+        columns = as_columns(samples)
+        if len(columns) < 2:
+            return samples.copy()
+
+        # Position of every output sample in the input, split into the
+        # sample before it and the fraction of the way to the next one; the
+        # last position is at most the last input sample, never past it
+        positions = np.arange(int((len(columns) - 1) / self.ratio) + 1) * self.ratio
+        before = np.minimum(positions.astype(np.intp), len(columns) - 2)
+        fraction = (positions - before).astype(samples.dtype)[:, None]
+
+        shifted = columns[before] + (columns[before + 1] - columns[before]) * fraction
+        return shifted if samples.ndim == 2 else shifted.reshape(-1)
+
+    def is_noop(self):
+        return self.semitones == 0
@@ -1,14 +1,159 @@
+import numpy as np
+import pygame
+import pygame.sndarray as sndarray
+
+# Float type the plugins process samples in. float32 holds 16-bit audio with
+# plenty of headroom at half the memory traffic of float64.
+DEFAULT_PROCESSING_DTYPE = np.float32
+
+_processing_dtype = np.dtype(DEFAULT_PROCESSING_DTYPE)
+
+
 class AudioPlugin:
     """Base class for all audio processing plugins."""
 
+    # Attributes that hold values derived while processing rather than
+    # settings; describe() leaves them out
+    DERIVED_ATTRIBUTES = ('sample_rate',)
+
     def process_sound(self, sound):
         """
         Process a pygame Sound object.
 
+        Converts the sound to a float array (in the processing dtype) once,
+        runs `process_samples` and builds a new Sound from the clipped result.
+
         Args:
             sound (pygame.mixer.Sound): Input sound
 
         Returns:
             pygame.mixer.Sound: Processed sound
         """
-        raise NotImplementedError("Subclasses must implement process_sound")
+        try:
+            # Convert sound to numpy array using sndarray (safer than raw bytes)
+            samples = sndarray.array(sound)
+
+            processed = self.process_samples(samples.astype(_processing_dtype), get_sample_rate())
+
+            # Convert back to original data type and create new sound
+            return make_sound(processed, samples.dtype)
+
+        except Exception as e:
+            print(f"{self.__class__.__name__} error: {e}")
+            # Return original sound if processing fails
+            return sound
+
+    def process_samples(self, samples, sample_rate):
+        """
+        Process a float sample array.
+
+        All channels are processed together: stateful plugins keep one
+        state per column, indexed by the channel number. Float input is
+        processed in its own precision, integer input in the processing dtype.
+
+        Args:
+            samples (numpy.ndarray): Samples in int16 scale, shaped (frames,) or (frames, channels)
+            sample_rate (int): Sample rate in Hz
+
+        Returns:
+            numpy.ndarray: Processed float samples, same shape as the input
+        """
+        raise NotImplementedError("Subclasses must implement process_samples")
+
+    def reset_state(self):
+        """Forget everything carried over from previously processed audio."""
+
+    def is_noop(self):
+        """
+        Whether the plugin passes audio through unchanged with its current settings.
+
+        Chain compilation drops such stages. Plugins that can't tell return False.
+        """
+        return False
+
+    def describe(self):
+        """
+        Describe the plugin settings.
+
+        Collects the public attributes holding plain values (numbers, strings,
+        booleans) and nested plugins. Processing state (dicts, arrays,
+        filter engines) and DERIVED_ATTRIBUTES are left out, so the result
+        only changes when the settings do.
+
+        Returns:
+            dict: JSON-serializable settings, including the plugin class name
+        """
+        description = {'plugin': self.__class__.__name__}
+        for name, value in sorted(vars(self).items()):
+            if name.startswith('_') or name in self.DERIVED_ATTRIBUTES:
+                continue
+            value = _describe_value(value)
+            if value is not None:
+                description[name] = value
+        return description
+
+
+def _describe_value(value):
+    """JSON-friendly form of a setting, or None for values that are not settings."""
+    if isinstance(value, AudioPlugin):
+        return value.describe()
+    if isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        values = [_describe_value(item) for item in value]
+        if values and None not in values:
+            return values
+    return None
+
+
+def as_columns(samples):
+    """View samples as (frames, channels); mono audio becomes a single column."""
+    return samples if samples.ndim == 2 else samples.reshape(-1, 1)
+
+
+def get_processing_dtype():
+    """Return the float dtype used to process integer samples."""
+    return _processing_dtype
+
+
+def set_processing_dtype(dtype):
+    """
+    Set the float dtype used to process integer samples.
+
+    Args:
+        dtype: A floating point dtype, e.g. numpy.float32 or numpy.float64
+    """
+    global _processing_dtype
+
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'f':
+        raise ValueError(f"Processing dtype must be a float type, got {dtype}")
+    _processing_dtype = dtype
+
+
+def to_float(samples, copy=False):
+    """
+    Return samples as a float array.
+
+    Float samples keep their precision, integer samples are converted to the
+    processing dtype. Without `copy` a float array is returned as it is.
+    """
+    samples = np.asarray(samples)
+    dtype = samples.dtype if samples.dtype.kind == 'f' else _processing_dtype
+    return samples.astype(dtype, copy=copy)
+
+
+def get_sample_rate():
+    """Return the sample rate of the initialized mixer."""
+    mixer = pygame.mixer.get_init()
+    if mixer is None:
+        raise RuntimeError("Pygame mixer not initialized")
+    return mixer[0]
+
+
+def make_sound(processed, dtype=np.int16):
+    """Clip float samples to the int16 range and build a Sound from them."""
+    processed = np.clip(processed, -32768, 32767).astype(dtype)
+    return sndarray.make_sound(np.ascontiguousarray(processed))
@@ -15,4 +15,7 @@ class ReversePlugin(AudioPlugin):
         # Use sndarray.make_sound() with the contiguous array
         reversed_sound = sndarray.make_sound(reversed_samples_contiguous)
 
-        return reversed_sound
\ No newline at end of file
+        return reversed_sound
+
+    def process_samples(self, samples, sample_rate):
+        return samples[::-1]
@@ -0,0 +1,78 @@
+import numpy as np
+from pygame import sndarray
+
+from lib.audio.plugin import AudioPlugin, as_columns, get_sample_rate, to_float
+
+
+class TrimPlugin(AudioPlugin):
+    """
+    Plugin to cut leading and trailing silence off audio.
+
+    Levels are measured against the peak of the audio, so quiet and loud
+    recordings are trimmed alike. Besides trimming, `analyze` finds the
+    onset: how long after the (trimmed) start the audio first gets loud,
+    which is how late the sound is heard after it is played.
+    """
+
+    def __init__(self, silence_db=-60.0, onset_db=-40.0):
+        """
+        Initialize trim plugin.
+
+        Args:
+            silence_db (float): Level relative to the peak below which audio counts as silence
+            onset_db (float): Level relative to the peak at which the sound is considered started
+        """
+        self.silence_db = silence_db
+        self.onset_db = onset_db
+
+    def analyze(self, samples):
+        """
+        Find the audible part and the onset of audio.
+
+        Args:
+            samples (numpy.ndarray): Samples shaped (frames,) or (frames, channels)
+
+        Returns:
+            tuple: (start, end, onset) in frames; samples[start:end] is the audible
+                part and onset counts from start. Silent audio is kept whole.
+        """
+        levels = np.abs(to_float(as_columns(samples))).max(axis=1)
+        peak = levels.max() if len(levels) else 0
+        if peak == 0:
+            return 0, len(levels), 0
+
+        audible = np.flatnonzero(levels > peak * 10 ** (self.silence_db / 20.0))
+        start, end = audible[0], audible[-1] + 1
+        onset = np.argmax(levels[start:end] >= peak * 10 ** (self.onset_db / 20.0))
+        return int(start), int(end), int(onset)
+
+    def process_sound(self, sound):
+        """Trim the silence off a sound."""
+        try:
+            return self.trim_sound(sound)[0]
+
+        except Exception as e:
+            print(f"Trim plugin error: {e}")
+            return sound
+
+    def process_samples(self, samples, sample_rate):
+        """Trim the silence off a float sample array."""
+        start, end, _ = self.analyze(samples)
+        return to_float(samples[start:end], copy=True)
+
+    def trim_sound(self, sound):
+        """
+        Trim the silence off a sound and measure its onset.
+
+        Args:
+            sound (pygame.mixer.Sound): Input sound
+
+        Returns:
+            tuple: (sound, onset_ms); the input sound itself if there was nothing to trim
+        """
+        # Analyzed through a view of the sound's buffer; only a trimmed sound is copied
+        samples = sndarray.samples(sound)
+        start, end, onset = self.analyze(samples)
+        if start > 0 or end < len(samples):
+            sound = sndarray.make_sound(samples[start:end])
+        return sound, onset * 1000.0 / get_sample_rate()
@@ -1,5 +1,10 @@
+from lib.player.events import compile_narrative
+
+
 class MediaInfo:
     def __init__(self, narrative_data, signature_key, musical_key=None):
         self.narrative_data = narrative_data
         self.signature_key = signature_key
         self.musical_key = musical_key
+        # Compiled once, where the narrative is produced; every repeat plays it
+        self.compiled_narrative = compile_narrative(narrative_data)
@@ -103,6 +103,13 @@ class MediaProvider:
             self.log.info("Narrative data queue is empty.")
             return None
 
+    def peek_next_media_info(self):
+        """Return the media info get_next_media_info will hand out next, without taking it off the queue."""
+        with self.narrative_data_queue.mutex:
+            if self.narrative_data_queue.queue:
+                return self.narrative_data_queue.queue[0]
+        return None
+
     def get_next_key_class(self):
         current_producing_key_class = self.currently_producing_key_class
         narrative_offset = self.num_of_narratives_produced % self.num_of_narratives
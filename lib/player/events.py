@@ -0,0 +1,155 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Event types by code; the code also orders events sharing a beat
+EVENT_TYPES = ('chord', 'melody', 'drum', 'bass')
+EVENT_TYPE_ORDER = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+
+# One compiled event: when, what kind, and which sample (index into CompiledNarrative.names)
+EVENT_DTYPE = np.dtype([('beat_time', np.float64), ('type', np.uint8), ('sample', np.uint16)])
+
+# Compiled narratives without drums or bass kept by signature key
+COMPILED_CACHE_SIZE = 64
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+class CompiledNarrative:
+    """
+    A narrative flattened into one sorted array of events.
+
+    `events` is a structured array (EVENT_DTYPE) sorted by beat time, then
+    by type; the sample of an event is an index into `names`, which lists
+    every sample the narrative plays in order of first use.
+    """
+
+    def __init__(self, events, names, bars):
+        """
+        Args:
+            events (numpy.ndarray): Sorted EVENT_DTYPE array
+            names (list): Sample names indexed by the events' sample field
+            bars (int): Number of bars in the narrative
+        """
+        self.events = events
+        self.names = names
+        self.bars = bars
+
+    def __len__(self):
+        return len(self.events)
+
+
+def compile_narrative(narrative_data):
+    """
+    Flatten a narrative into a CompiledNarrative.
+
+    Args:
+        narrative_data: A list of Bar objects
+
+    Returns:
+        CompiledNarrative: The narrative's events, sorted by beat time, then by type
+    """
+    sample_ids = {}
+    beat_times = []
+    types = []
+    samples = []
+
+    def add(event_type, name, beat_time):
+        beat_times.append(beat_time)
+        types.append(EVENT_TYPE_ORDER[event_type])
+        samples.append(sample_ids.setdefault(name, len(sample_ids)))
+
+    for bar_index, bar_data in enumerate(narrative_data):
+        bar_start_beat = bar_index * 4
+        if bar_data.bass:
+            for bass_note, beat_offset in bar_data.bass:
+                add('bass', bass_note, bar_start_beat + beat_offset)
+
+        # We assume bar_data.chords is a list of tuples: [('chord_name', beat_offset)]
+        for chord_name, beat_offset in bar_data.chords:
+            add('chord', chord_name, bar_start_beat + beat_offset)
+
+        # We assume bar_data.melody_notes is a list of tuples: [('note_name', beat_offset)]
+        for note_name, beat_offset in bar_data.melody_notes:
+            add('melody', note_name, bar_start_beat + beat_offset)
+
+        if bar_data.drums:
+            kicks, hi_hats = bar_data.drums
+            if kicks:
+                for _, beat_offset in kicks:
+                    add('drum', 'Kick', bar_start_beat + beat_offset)
+
+            if hi_hats:
+                for _, beat_offset in hi_hats:
+                    add('drum', 'HiHat', bar_start_beat + beat_offset)
+
+    events = np.empty(len(beat_times), dtype=EVENT_DTYPE)
+    events['beat_time'] = beat_times
+    events['type'] = types
+    events['sample'] = samples
+
+    # Stable, so events sharing beat and type keep the order they were added in
+    events = events[np.lexsort((events['type'], events['beat_time']))]
+    return CompiledNarrative(events, list(sample_ids), len(narrative_data))
+
+
+def get_compiled_narrative(narrative_data, signature_key=None):
+    """
+    Compile a narrative, reusing the result for narratives played before.
+
+    A signature only records chords and melody, so only narratives without
+    drums or bass (such as replays parsed back from a signature) are kept by
+    signature key, the last COMPILED_CACHE_SIZE of them, shared by every
+    player in the process. A narrative with drums or bass should be compiled
+    once by whatever holds it, like MediaInfo does, and passed compiled.
+
+    Args:
+        narrative_data: A list of Bar objects, or a CompiledNarrative
+        signature_key: Signature of the narrative, None to compile without caching
+
+    Returns:
+        CompiledNarrative: The compiled narrative
+    """
+    if isinstance(narrative_data, CompiledNarrative):
+        return narrative_data
+    if signature_key is None or any(bar_data.drums or bar_data.bass for bar_data in narrative_data):
+        return compile_narrative(narrative_data)
+
+    with _compiled_lock:
+        compiled = _compiled.get(signature_key)
+        if compiled is not None:
+            _compiled.move_to_end(signature_key)
+            return compiled
+
+    compiled = compile_narrative(narrative_data)
+    with _compiled_lock:
+        _compiled[signature_key] = compiled
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def as_compiled(narrative_data):
+    """Return a narrative as a CompiledNarrative, compiling a list of Bar objects."""
+    if isinstance(narrative_data, CompiledNarrative):
+        return narrative_data
+    return compile_narrative(narrative_data)
+
+
+def narrative_sample_names(narrative_data):
+    """List the names of the samples a narrative plays, in order of first use."""
+    names = []
+    for bar_data in narrative_data:
+        if bar_data.bass:
+            names.extend(bass_note for bass_note, _ in bar_data.bass)
+        names.extend(chord_name for chord_name, _ in bar_data.chords)
+        names.extend(note_name for note_name, _ in bar_data.melody_notes)
+        if bar_data.drums:
+            kicks, hi_hats = bar_data.drums
+            if kicks:
+                names.append('Kick')
+            if hi_hats:
+                names.append('HiHat')
+    return list(dict.fromkeys(names))
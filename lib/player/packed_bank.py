@@ -0,0 +1,185 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import pygame
+
+from lib.audio.plugin import get_processing_dtype
+from lib.log import Logger
+
+DEFAULT_BANK_PATH = "sample_bank.bin"
+
+BANK_MAGIC = b"SMPLBANK"
+BANK_VERSION = 1
+
+# magic, version, header length
+_PREAMBLE = struct.Struct("<8sII")
+
+# PCM data of every sample starts on a multiple of this many bytes
+_ALIGNMENT = 64
+
+log = Logger.get_log("PackedBank")
+
+
+def entry_metadata(path, chain, trim=None):
+    """
+    Describe what a packed sample was made from.
+
+    A packed sample is only used while this is unchanged: same source file
+    (by size and modification time), same plugin chain and trim settings.
+
+    Args:
+        path (str): Path of the source WAV file
+        chain: Plugin chain the sample is processed with, None if unprocessed
+        trim: TrimPlugin the processed sample is trimmed with, None if untrimmed
+
+    Returns:
+        dict: JSON-serializable metadata
+    """
+    stat = os.stat(path)
+    return _normalized({
+        'source': path,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'chain': chain.describe() if chain is not None else None,
+        'trim': trim.describe() if trim is not None else None,
+    })
+
+
+def bank_settings():
+    """Mixer format and processing dtype the packed samples depend on."""
+    return _normalized({
+        'mixer': pygame.mixer.get_init(),
+        'dtype': get_processing_dtype().name,
+    })
+
+
+def write_packed_bank(bank_path, sounds, metadata):
+    """
+    Write samples into one packed bank file.
+
+    The file holds a fixed preamble, a JSON index and the raw PCM data of
+    every sample, back to back, in the mixer's own format.
+
+    Args:
+        bank_path (str): Output file, replaced atomically
+        sounds (dict): pygame Sound objects by sample name
+        metadata (dict): `entry_metadata` of every sample, by name
+    """
+    entries = {}
+    buffers = []
+    offset = 0
+    for name, sound in sounds.items():
+        raw = sound.get_raw()
+        entries[name] = {'offset': offset, 'length': len(raw), 'metadata': metadata[name]}
+        buffers.append(raw)
+        offset = _aligned(offset + len(raw))
+
+    header = json.dumps({'settings': bank_settings(), 'entries': entries}).encode()
+    data_start = _aligned(_PREAMBLE.size + len(header))
+
+    temp_path = f"{bank_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as bank:
+        bank.write(_PREAMBLE.pack(BANK_MAGIC, BANK_VERSION, len(header)))
+        bank.write(header)
+        for name, raw in zip(entries, buffers):
+            bank.write(b"\0" * (data_start + entries[name]['offset'] - bank.tell()))
+            bank.write(raw)
+    os.replace(temp_path, bank_path)
+
+
+class PackedBank:
+    """
+    Read-only view of a packed bank file.
+
+    The file is memory-mapped, so opening it reads nothing but the index,
+    every sample is one contiguous slice of the mapping, and processes using
+    the same bank share its pages in the page cache.
+    """
+
+    def __init__(self, bank_path):
+        """
+        Open and map a bank file.
+
+        Args:
+            bank_path (str): Path of a file written by `write_packed_bank`
+
+        Raises:
+            ValueError: If the file isn't a packed bank of a supported version
+        """
+        self.bank_path = bank_path
+        with open(bank_path, 'rb') as bank:
+            self.data = mmap.mmap(bank.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.data) < _PREAMBLE.size:
+            raise ValueError(f"{bank_path} is not a packed sample bank")
+        magic, version, header_length = _PREAMBLE.unpack_from(self.data)
+        if magic != BANK_MAGIC or version != BANK_VERSION:
+            raise ValueError(f"{bank_path} is not a version {BANK_VERSION} packed sample bank")
+
+        header = json.loads(self.data[_PREAMBLE.size:_PREAMBLE.size + header_length])
+        self.settings = header['settings']
+        self.entries = header['entries']
+        self.data_start = _aligned(_PREAMBLE.size + header_length)
+
+    def is_compatible(self):
+        """Whether the bank was built for the current mixer format and processing dtype."""
+        return self.settings == bank_settings()
+
+    def sounds(self, names, metadata):
+        """
+        Build Sound objects for the packed samples that are still up to date.
+
+        Args:
+            names: Sample names to look up
+            metadata: Callable returning the current `entry_metadata` of a name
+
+        Returns:
+            dict: Sound objects by name; stale or missing names are left out
+        """
+        sounds = {}
+        if not self.is_compatible():
+            return sounds
+
+        view = memoryview(self.data)
+        for name in names:
+            entry = self.entries.get(name)
+            if entry is None or entry['metadata'] != metadata(name):
+                continue
+            start = self.data_start + entry['offset']
+            sounds[name] = pygame.mixer.Sound(buffer=view[start:start + entry['length']])
+        return sounds
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _normalized(value):
+    """Round-trip through JSON, so values compare equal to what was read back from a bank."""
+    return json.loads(json.dumps(value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process every sample and write them into one packed bank file.")
+    parser.add_argument("--config", type=str, default="sample_config.json", help="Sample config to pack")
+    parser.add_argument("--output", type=str, default=DEFAULT_BANK_PATH, help="Bank file to write")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes used to prepare the samples")
+    args = parser.parse_args()
+
+    # Imported here because the loader imports this module
+    from lib.player.sample_loader import load_samples
+
+    # Building needs the mixer format, not an audio device
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.mixer.init()
+
+    samples = load_samples(args.config, lazy=True, workers=args.workers)
+    samples.pack(args.output)
+    log.info(f"Packed {len(samples)} samples into {args.output}")
+
+
+if __name__ == '__main__':
+    main()
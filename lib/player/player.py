@@ -1,30 +1,56 @@
 import time
 from enum import Enum
 
+import numpy as np
+
 from lib.history.history_manager import HistoryManager
 from lib.log import Logger
+from lib.player.events import EVENT_TYPE_ORDER, get_compiled_narrative, narrative_sample_names
+from lib.player.renderer import OfflineRenderer
 from lib.player.sample_loader import load_samples
+from lib.player.sample_watcher import DEFAULT_POLL_INTERVAL, SampleWatcher
+from lib.player.scheduler import DEFAULT_LATE_THRESHOLD_MS, LATE_PLAY, EventScheduler
+from lib.player.stream import DEFAULT_BARS_AHEAD, StreamPlayback
+from lib.player.transport import Transport
 
 import pygame
 
 MIXER_RUNNING = False
 
+# Codes of the event types in a compiled narrative
+CHORD = EVENT_TYPE_ORDER['chord']
+MELODY = EVENT_TYPE_ORDER['melody']
+DRUM = EVENT_TYPE_ORDER['drum']
+BASS = EVENT_TYPE_ORDER['bass']
+
 
 class Channels(Enum):
     CHORDS_CHANNEL = 0
     MELODY_CHANNEL = 1
     DRUMS_CHANNEL = 2
+    STREAM_CHANNEL = 3
     BASS_CHANNEL = 4
 
 
 class Player:
-    def __init__(self, name="Radio", bpm=72, sample_config="sample_config.json"):
+    def __init__(self, name="Radio", bpm=72, sample_config="sample_config.json", sample_workers=None,
+                 keys=None, lazy_samples=False, sample_bank=None, draft_samples=False, stream=False,
+                 bars_ahead=DEFAULT_BARS_AHEAD, late_events=LATE_PLAY, late_threshold_ms=DEFAULT_LATE_THRESHOLD_MS):
         """
         Initializes the music player.
 
         Args:
             bpm (int): Beats per minute for tempo control.
             sample_config (str): The path to the JSON file with sample mappings.
+            sample_workers (int): Processes used to prepare the samples (None for in-process).
+            keys (list): Keys classes that will be played; only their samples are loaded up front.
+            lazy_samples (bool): Load no samples up front, each one is loaded when first needed.
+            sample_bank (str): Packed bank file to take the processed samples from.
+            draft_samples (bool): Start with cheaply processed samples and upgrade them in the background.
+            stream (bool): Play songs as pre-mixed blocks on one channel instead of sample by sample.
+            bars_ahead (int): Bars mixed ahead of the playhead when streaming.
+            late_events (str): What to do with events later than late_threshold_ms, "play" or "drop".
+            late_threshold_ms (float): Lateness from which an event counts as late.
         """
         self.name = name
         self.bpm = bpm
@@ -39,15 +65,25 @@ class Player:
         self.melody_channel = pygame.mixer.Channel(Channels.MELODY_CHANNEL.value)
         self.drums_channel = pygame.mixer.Channel(Channels.DRUMS_CHANNEL.value)
         self.bass_channel = pygame.mixer.Channel(Channels.BASS_CHANNEL.value)
-        self.samples = load_samples(sample_config)
+        self.stream_channel = pygame.mixer.Channel(Channels.STREAM_CHANNEL.value)
+        self.stream = stream
+        self.bars_ahead = bars_ahead
+        self.sample_config = sample_config
+        self.sample_workers = sample_workers
+        self.sample_bank = sample_bank
+        self.samples = load_samples(sample_config, workers=sample_workers, keys=keys, lazy=lazy_samples,
+                                    bank_path=sample_bank, draft=draft_samples)
+        self.sample_watcher = None
+        self.scheduler = EventScheduler(late_policy=late_events, late_threshold_ms=late_threshold_ms,
+                                        name=f"Scheduler - {name}")
 
         self.currently_playing = None
         self.currently_playing_key = None
         self.history_manager = HistoryManager()
 
-        self.pause = False
-        self.playing = False
-        self.skip = False
+        # Pause, skip and stop, which every wait in play_music is woken by
+        self.transport = Transport()
+        self.in_song = False
 
     def play_music(self, narrative_data, signature_key=None, metadata=None):
         """
@@ -57,7 +93,8 @@ class Player:
         list of `Bar` objects and schedules each note and chord with precise timing.
 
         Args:
-            narrative_data: A list of Bar objects containing chord and melody info.
+            narrative_data: A list of Bar objects containing chord and melody info, or their
+                CompiledNarrative.
             signature_key: signature of the song
             metadata: any metadata {}
         """
@@ -72,7 +109,16 @@ class Player:
 
         self.log.info(f"Playing {self.currently_playing_key} at {self.bpm} BPM...")
 
-        start_time_ms = pygame.time.get_ticks()
+        # Compiled once per song; repeats and replays of it reuse the events
+        compiled = get_compiled_narrative(narrative_data, signature_key)
+
+        # Samples that aren't loaded yet are loaded now, not in the middle of the song
+        self.samples.load(compiled.names)
+
+        # Each sample is played its onset ahead of its beat so that it is heard
+        # on the beat; the song starts later by the largest onset to allow for it
+        onsets = np.array([self.samples.onsets.get(name, 0.0) for name in compiled.names])
+        lead_in_ms = float(onsets.max(initial=0.0))
 
         if type(self.currently_playing_key) == str:
             musical_key = self.currently_playing_key
@@ -82,109 +128,120 @@ class Player:
         self.history_manager.add_to_history(signature_key=signature_key,
                                             musical_key=musical_key)
 
-        # To manage both chord and melody timing, we will flatten both into a single,
-        # chronologically sorted list of events.
-        event_list = []
-        for bar_index, bar_data in enumerate(narrative_data):
-
-            while self.pause:
-                # makes the call blocking
-                print("Player is paused")
-                self.playing = False
-                time.sleep(1)
-
-            self.playing = True
-            bar_start_beat = bar_index * 4
-            if bar_data.bass:
-                for bass_note, beat_offset in bar_data.bass:
-                    event_list.append({
-                        'type': 'bass',
-                        'name': bass_note,
-                        'beat_time': bar_start_beat + beat_offset
-                    })
-
-            # Add all chord events for this bar to the event list
-            # We now assume bar_data.chords is a list of tuples: [('chord_name', beat_offset)]
-            for chord_name, beat_offset in bar_data.chords:
-                event_list.append({
-                    'type': 'chord',
-                    'name': chord_name,
-                    'beat_time': bar_start_beat + beat_offset
-                })
-
-            # Add all melody events for this bar to the event list
-            # We assume bar_data.melody_notes is a list of tuples: [('note_name', beat_offset)]
-            for note_name, beat_offset in bar_data.melody_notes:
-                event_list.append({
-                    'type': 'melody',
-                    'name': note_name,
-                    'beat_time': bar_start_beat + beat_offset
-                })
-
-            if bar_data.drums:
-                kicks, hi_hats = bar_data.drums
-                if kicks:
-                    for _, beat_offset in kicks:
-                        event_list.append({
-                            'type': 'drum',
-                            'name': 'Kick',
-                            'beat_time': bar_start_beat + beat_offset
-                        })
-
-                if hi_hats:
-                    for _, beat_offset in hi_hats:
-                        event_list.append({
-                            'type': 'drum',
-                            'name': 'HiHat',
-                            'beat_time': bar_start_beat + beat_offset
-                        })
-
-        type_order = {'chord': 0, 'melody': 1, 'drum': 2, 'bass': 3}
-        # Sort all events by their beat time to ensure correct playback order
-        event_list.sort(key=lambda x: (x['beat_time'], type_order.get(x['type'], 99)))
-
-        # Now iterate through the sorted events and play them
-        for event in event_list:
-            if self.skip:
-                self.log.info("Skipping this music")
-                return self.cleanup()
-            expected_play_time_ms = start_time_ms + (event['beat_time'] * self.beat_duration_ms)
-
-            time_to_wait = expected_play_time_ms - pygame.time.get_ticks()
-            if time_to_wait > 0:
-                pygame.time.wait(int(time_to_wait))
-
-            sound = self.samples.get(event['name'])
-            if sound:
-                if event['type'] == 'bass':
-                    self.bass_channel.stop()
-                    self.bass_channel.play(sound)
-                elif event['type'] == 'chord':
-                    self.chords_channel.play(sound)
-                    # print(f"Chord: {event['name']}")
-                elif event['type'] == 'melody':
-                    self.melody_channel.queue(sound)
-                    # print(f"  Note: {event['name']}")
-                elif event['type'] == 'drum':
-                    self.drums_channel.play(sound)
-            else:
-                pass
-                # print(f"{event['name']} Sound not found")
-
-        # Add a final wait at the end of the song to ensure all notes are played
-        total_beats = len(narrative_data) * 4
-        final_wait_time = start_time_ms + (total_beats * self.beat_duration_ms) - pygame.time.get_ticks()
-        if final_wait_time > 0:
-            pygame.time.wait(int(final_wait_time))
-
-        self.history_manager.incr_played(signature_key=signature_key)
+        if self.pause:
+            # makes the call blocking
+            self.log.info("Player is paused")
+        if not self.transport.wait_while_paused():
+            self.log.info("Skipping this music")
+            return self.cleanup()
+
+        self.in_song = True
+
+        if self.stream:
+            return self.stream_music(compiled, signature_key)
+
+        # The events are in beat order; play them in the order of their play time,
+        # i.e. with each sample's onset taken off its beat
+        events = compiled.events
+        play_times_ms = events['beat_time'] * self.beat_duration_ms - onsets[events['sample']]
+        order = np.lexsort((events['type'], play_times_ms))
+
+        # Times are absolute from the start (in perf_counter_ns), so waking late
+        # for one event doesn't push back the ones after it
+        start_ns = time.perf_counter_ns() + int(lead_in_ms * 1_000_000)
+        times_ns = (start_ns + np.round(play_times_ms[order] * 1_000_000)).astype(np.int64).tolist()
+        payloads = zip(events['type'][order].tolist(), [compiled.names[sample] for sample in events['sample'][order]])
+        end_ns = start_ns + int(compiled.bars * 4 * self.beat_duration_ms * 1_000_000)
+
+        # Blocks until the song has played; the final wait lets the last notes ring
+        if self.scheduler.run(zip(times_ns, payloads), self.play_event, end_ns=end_ns, transport=self.transport,
+                              prepare=self.prepare_event):
+            self.history_manager.incr_played(signature_key=signature_key)
+        else:
+            self.log.info("Skipping this music")
         self.cleanup()
 
+    def prepare_event(self, event):
+        """
+        Look up the sound of one event of a compiled narrative, loading it if needed.
+
+        Args:
+            event (tuple): (event type code, sample name)
+
+        Returns:
+            tuple: (event type code, Sound or None), for play_event
+        """
+        event_type, name = event
+        return event_type, self.samples.get(name)
+
+    def play_event(self, event):
+        """
+        Play one prepared event on its channel.
+
+        Args:
+            event (tuple): (event type code, Sound or None), from prepare_event
+        """
+        event_type, sound = event
+        if sound:
+            if event_type == BASS:
+                self.bass_channel.stop()
+                self.bass_channel.play(sound)
+            elif event_type == CHORD:
+                self.chords_channel.play(sound)
+            elif event_type == MELODY:
+                self.melody_channel.queue(sound)
+            elif event_type == DRUM:
+                self.drums_channel.play(sound)
+
+    def stream_music(self, narrative_data, signature_key=None):
+        """
+        Play a narrative as blocks mixed a few bars ahead, on the stream channel.
+
+        Args:
+            narrative_data: A list of Bar objects, or a CompiledNarrative
+            signature_key: signature of the song
+        """
+        # A new renderer per song picks up the current samples and tempo
+        playback = StreamPlayback(OfflineRenderer(self.samples, self.bpm), self.stream_channel, self.bars_ahead)
+        if playback.play(narrative_data, transport=self.transport):
+            self.history_manager.incr_played(signature_key=signature_key)
+        else:
+            self.log.info("Skipping this music")
+        self.cleanup()
+
+    def prefetch_samples(self, narrative_data):
+        """
+        Load the samples of an upcoming narrative in the background.
+
+        Args:
+            narrative_data: A list of Bar objects
+
+        Returns:
+            threading.Thread: The loading thread, or None if every sample is loaded already
+        """
+        return self.samples.prefetch(narrative_sample_names(narrative_data))
+
+    def watch_samples(self, interval=DEFAULT_POLL_INTERVAL):
+        """
+        Reload changed samples in the background whenever the sample or chain config changes.
+
+        Args:
+            interval (float): Seconds between two checks of the config files
+
+        Returns:
+            SampleWatcher: The running watcher
+        """
+        if self.sample_watcher is None:
+            self.sample_watcher = SampleWatcher(self, self.sample_config, workers=self.sample_workers,
+                                                bank_path=self.sample_bank, interval=interval)
+        self.sample_watcher.start()
+        return self.sample_watcher
+
     def cleanup(self):
         self.currently_playing = None
         self.currently_playing_key = None
-        self.playing = False
-        self.skip = False
+        self.in_song = False
+        self.transport.clear()
 
     def save_history(self, file_name=None):
         self.history_manager.save_history(file_name=file_name)
@@ -208,18 +265,57 @@ class Player:
     def dislike(self, signature_key):
         self.history_manager.dislike(signature_key=signature_key)
 
+    @property
+    def pause(self):
+        return self.transport.paused
+
+    @property
+    def skip(self):
+        return self.transport.skipping
+
+    @property
+    def playing(self):
+        """True while a song is playing and not paused."""
+        return self.in_song and not self.transport.paused
+
     def skip_current_media(self):
-        self.skip = True
+        self.transport.skip()
+
+    def stop(self):
+        """Stop the current song at once, cutting off the sounds it is playing."""
+        with self.transport.condition:
+            self.transport.stop()
+            self._stop_channels(self.chords_channel, self.melody_channel, self.drums_channel,
+                                self.bass_channel, self.stream_channel)
 
     def set_pause(self):
-        self.pause = True
+        """
+        Pause playback at once.
+
+        The sounds playing are cut off (the channels may be taken over by another
+        player while this one is paused), and the rest of the song resumes where
+        it left off on set_unpause. A stream is paused mid-block instead.
+        """
+        with self.transport.condition:
+            self.transport.pause()
+            self.stream_channel.pause()
+            if self.in_song:
+                self._stop_channels(self.chords_channel, self.melody_channel, self.drums_channel,
+                                    self.bass_channel)
 
     def set_unpause(self):
-        self.pause = False
+        with self.transport.condition:
+            self.transport.resume()
+            self.stream_channel.unpause()
 
     def is_playing(self):
         return self.playing
 
+    @staticmethod
+    def _stop_channels(*channels):
+        for channel in channels:
+            channel.stop()
+
     def set_bpm(self, bpm):
         self.bpm = bpm
         self.beat_duration_ms = (60 / bpm) * 1000
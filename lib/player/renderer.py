@@ -0,0 +1,189 @@
+import wave
+
+import numpy as np
+import pygame.sndarray as sndarray
+
+from lib.audio.plugin import as_columns, get_sample_rate
+from lib.player.events import EVENT_TYPES, as_compiled
+
+# Player channel each event type is played on
+EVENT_CHANNELS = {'chord': 'chords', 'melody': 'melody', 'drum': 'drums', 'bass': 'bass'}
+
+
+class OfflineRenderer:
+    """
+    Mixes narratives into a sample buffer instead of playing them in real time.
+
+    Every event starts on the exact frame of its beat (less the onset of its
+    sample, like in `Player.play_music`), and the channels behave like the
+    player's pygame channels: a chord, drum or bass sound cuts off the sound
+    playing on its channel, while a melody note is queued behind the note
+    that is playing, replacing a note queued before it.
+    """
+
+    def __init__(self, samples, bpm, sample_rate=None):
+        """
+        Initialize the renderer.
+
+        Args:
+            samples (SampleBank): Samples to render with, e.g. `Player.samples`
+            bpm (int): Beats per minute
+            sample_rate (int): Frames per second, the mixer's rate by default
+        """
+        self.samples = samples
+        self.bpm = bpm
+        self.sample_rate = sample_rate or get_sample_rate()
+
+    def render(self, narrative_data, include_tail=True):
+        """
+        Mix a narrative into one buffer.
+
+        Args:
+            narrative_data: A list of Bar objects, or a CompiledNarrative
+            include_tail (bool): Keep sounds ringing past the last bar; otherwise
+                the buffer ends with the last bar, like `play_music` returns
+
+        Returns:
+            numpy.ndarray: int16 frames shaped (frames, channels)
+        """
+        placements, song_frames = self.schedule(narrative_data)
+        return _mix(placements, 0, _total_frames(placements, song_frames, include_tail))
+
+    def render_blocks(self, narrative_data, block_frames, include_tail=True):
+        """
+        Mix a narrative block by block.
+
+        Only the block being mixed is held in memory, however long the song is.
+
+        Args:
+            narrative_data: A list of Bar objects, or a CompiledNarrative
+            block_frames (int): Frames per block; the last block may be shorter
+            include_tail (bool): See `render`
+
+        Yields:
+            numpy.ndarray: int16 frames shaped (frames, channels), in order
+        """
+        placements, song_frames = self.schedule(narrative_data)
+        total_frames = _total_frames(placements, song_frames, include_tail)
+        for block_start in range(0, total_frames, block_frames):
+            yield _mix(placements, block_start, min(block_frames, total_frames - block_start))
+
+    def frames_per_bar(self):
+        """Return the length of a bar in frames."""
+        return int(round(4 * 60.0 * self.sample_rate / self.bpm))
+
+    def schedule(self, narrative_data):
+        """
+        Work out which part of which sample plays from which frame.
+
+        Args:
+            narrative_data: A list of Bar objects, or a CompiledNarrative
+
+        Returns:
+            tuple: (placements, song_frames); placements is a list of (start frame,
+                int16 frames shaped (frames, channels)), song_frames the length of
+                the song up to the end of its last bar
+        """
+        compiled = as_compiled(narrative_data)
+        self.samples.load(compiled.names)
+        frames_per_beat = 60.0 * self.sample_rate / self.bpm
+
+        onsets = np.array([int(round(self.samples.onsets.get(name, 0.0) * self.sample_rate / 1000.0))
+                           for name in compiled.names], dtype=np.int64)
+        lead_in = int(onsets.max(initial=0))
+        sounds = [self.samples.get(name) for name in compiled.names]
+        sample_data = [None if sound is None else as_columns(sndarray.samples(sound)) for sound in sounds]
+
+        events = compiled.events
+        starts = lead_in + np.round(events['beat_time'] * frames_per_beat).astype(np.int64) - onsets[events['sample']]
+        order = np.lexsort((events['type'], starts))
+
+        # Per channel: index of the placement playing last, and the queued melody note
+        playing = {}
+        queued = None
+        placements = []
+
+        def start_queued(until):
+            """Start the queued melody note if the note before it ends by `until`."""
+            nonlocal queued
+            if queued is not None and 'melody' in playing:
+                start, data = placements[playing['melody']]
+                if start + len(data) <= until:
+                    playing['melody'] = len(placements)
+                    placements.append((start + len(data), queued))
+                    queued = None
+
+        for start, event_type, sample in zip(starts[order].tolist(), events['type'][order].tolist(),
+                                             events['sample'][order].tolist()):
+            if sample_data[sample] is None:
+                continue
+            channel = EVENT_CHANNELS[EVENT_TYPES[event_type]]
+            if channel == 'melody':
+                start_queued(start)
+                if 'melody' in playing:
+                    current_start, current_data = placements[playing['melody']]
+                    if current_start + len(current_data) > start:
+                        # Channel.queue: played once the current note ends
+                        queued = sample_data[sample]
+                        continue
+            elif channel in playing:
+                # Playing a sound on a busy channel stops the sound before it
+                current_start, current_data = placements[playing[channel]]
+                placements[playing[channel]] = (current_start, current_data[:max(start - current_start, 0)])
+
+            playing[channel] = len(placements)
+            placements.append((start, sample_data[sample]))
+
+        start_queued(np.inf)
+
+        return placements, lead_in + int(round(compiled.bars * 4 * frames_per_beat))
+
+    def write_wav(self, narrative_data, path, include_tail=True):
+        """
+        Render a narrative into a WAV file.
+
+        Args:
+            narrative_data: A list of Bar objects, or a CompiledNarrative
+            path (str): Output file
+            include_tail (bool): See `render`
+        """
+        write_wav(path, self.render(narrative_data, include_tail), self.sample_rate)
+
+
+def _total_frames(placements, song_frames, include_tail):
+    """Length of the mix: the song, or up to the end of its last sound with the tail."""
+    if not include_tail:
+        return song_frames
+    return max([song_frames] + [start + len(data) for start, data in placements])
+
+
+def _mix(placements, start_frame, frames):
+    """Sum the placed samples falling into frames [start_frame, start_frame + frames)."""
+    channels = max((data.shape[1] for _, data in placements), default=2)
+    end_frame = start_frame + frames
+
+    # Summed in int32 and clipped once, like the mixer clips the sum of its channels
+    mix = np.zeros((frames, channels), dtype=np.int32)
+    for start, data in placements:
+        first = max(start, start_frame)
+        last = min(start + len(data), end_frame)
+        if first < last:
+            mix[first - start_frame:last - start_frame] += data[first - start:last - start]
+    return np.clip(mix, -32768, 32767).astype(np.int16)
+
+
+def write_wav(path, audio, sample_rate):
+    """
+    Write int16 audio to a WAV file.
+
+    Args:
+        path (str): Output file
+        audio (numpy.ndarray): int16 frames, (frames,) or (frames, channels)
+        sample_rate (int): Frames per second
+    """
+    audio = as_columns(np.asarray(audio, dtype=np.int16))
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(audio.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.ascontiguousarray(audio, dtype='<i2').tobytes())
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pygame
+
+from lib.audio.plugin import get_processing_dtype
+from lib.log import Logger
+
+DEFAULT_CACHE_DIR = ".sample_cache"
+
+# Bump when the processing code changes in a way the plugin settings don't show
+CACHE_VERSION = 3
+
+_READ_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """
+    Hash the contents of a file.
+
+    Args:
+        path (str): File to read
+
+    Returns:
+        str: SHA-256 hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(_READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SampleCache:
+    """
+    On-disk cache of processed samples.
+
+    Every entry is a .npy file named after a hash of everything the processed
+    buffer depends on: the contents of the source WAV file, the settings of
+    the plugin chain, the mixer format and the processing dtype. Changing
+    any of them gives a new key, so a stale entry is never read back.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str): Directory holding the cache entries, created if missing
+        """
+        self.cache_dir = cache_dir
+        self.log = Logger.get_log(self.__class__.__name__)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, path, chain, source_digest=None):
+        """
+        Compute the cache key of a sample.
+
+        Args:
+            path (str): Path of the source WAV file
+            chain: Plugin (or PluginChain) the sample is processed with
+            source_digest (str): `file_digest` of the source file, if already known
+
+        Returns:
+            str: Hex digest identifying the processed sample
+        """
+        settings = {
+            'version': CACHE_VERSION,
+            'source': source_digest or file_digest(path),
+            'chain': chain.describe(),
+            'mixer': pygame.mixer.get_init(),
+            'dtype': get_processing_dtype().name,
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def load(self, key):
+        """
+        Read a cached sample buffer.
+
+        Args:
+            key (str): Cache key from `key`
+
+        Returns:
+            numpy.ndarray: The stored samples, or None if there is no usable entry
+        """
+        entry_path = self._entry_path(key)
+        try:
+            return np.load(entry_path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.log.warning(f"Ignoring unreadable cache entry {entry_path}: {e}")
+            return None
+
+    def store(self, key, samples):
+        """
+        Write a sample buffer to the cache.
+
+        The entry is written to a temporary file first and renamed into place,
+        so a concurrent or interrupted writer never leaves a partial entry.
+
+        Args:
+            key (str): Cache key from `key`
+            samples (numpy.ndarray): Processed samples
+        """
+        entry_path = self._entry_path(key)
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as entry:
+                np.save(entry, samples)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            self.log.warning(f"Could not write cache entry {entry_path}: {e}")
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
@@ -1,66 +1,688 @@
+import os
+import threading
 import pygame
+import pygame.sndarray as sndarray
 import json
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 
-from lib.audio.compressor import Compressor, MultibandCompressor
-from lib.audio.equalizer import Equalizer
-from lib.audio.filter import FilterPresets
-from lib.audio.limiter import FastLimiter
+from lib.audio.chain import compile_chain, compile_chains
+from lib.audio.pitch import PitchShiftPlugin
+from lib.audio.plugin import get_processing_dtype, set_processing_dtype
+from lib.audio.trim import TrimPlugin
+from lib.player.packed_bank import PackedBank, entry_metadata, write_packed_bank
+from lib.player.sample_cache import DEFAULT_CACHE_DIR, SampleCache, file_digest
+from lib.player.synthesis import plan_synthesis
+from lib.keys import Keys
 from lib.log import Logger
 
 SAMPLES = None
 
+# Plugin chains of a loader worker process, set by _init_worker
+_WORKER_CHAINS = None
+
+# Samples every key can use
+DRUM_SAMPLES = ('Kick', 'HiHat')
+
+# Processing chains config, looked up next to the sample config
+CHAIN_CONFIG_NAME = "sample_chains.json"
+
 log = Logger.get_log("SampleLoader")
 
 
+class SampleBank(dict):
+    """
+    Dictionary of loaded samples that loads the other configured samples on demand.
+
+    Looking up a configured sample that isn't loaded yet (with [] or get)
+    decodes and processes it on the spot; `prefetch` does the same for a
+    list of names in a background thread, ahead of the time they are needed.
+
+    `load_drafts` fills the bank quickly with samples processed by cheap
+    draft chains; `upgrade` later replaces them with their full-quality
+    versions one by one.
+
+    With a trimmer, every sample has its leading and trailing silence cut
+    off as it enters the bank, and `onsets` holds how many milliseconds
+    after being played each sample becomes audible.
+
+    Samples with the same content key (same source audio through the same
+    chain) share one Sound: once one of them is loaded, the others are
+    stored without being loaded again. `memory_report` tells how much
+    memory the loaded samples take.
+    """
+
+    def __init__(self, paths, loader, metadata, draft_loader=None, trimmer=None, content_key=None,
+                 category=None):
+        """
+        Initialize an empty bank.
+
+        Args:
+            paths (dict): Path of every configured sample, by name
+            loader: Callable taking a list of names (and cached_only) and returning {name: Sound}
+            metadata: Callable returning the packed bank metadata of a name
+            draft_loader: Callable taking a list of names and returning {name: Sound}
+                processed by the draft chains
+            trimmer (TrimPlugin): Trims the samples and measures their onsets, None to keep them whole
+            content_key: Callable returning a hashable key of the source audio and chain of a name,
+                None to share nothing
+            category: Callable returning the chain name of a sample name, None for unprocessed samples
+        """
+        super().__init__()
+        self.paths = paths
+        self.loader = loader
+        self.metadata = metadata
+        self.draft_loader = draft_loader
+        self.trimmer = trimmer
+        self.content_key = content_key
+        self.category = category
+        self.lock = threading.Lock()
+
+        # Metadata of every loaded sample as it was when the sample was loaded;
+        # drafts have none, they don't match any full-quality sample
+        self.built_from = {}
+
+        # Names holding a draft sample, in loading order
+        self.drafts = {}
+
+        # Onset of every loaded sample in milliseconds
+        self.onsets = {}
+
+        # First loaded full-quality sample of every content key
+        self.by_content = {}
+
+        # Configured samples whose file can't be read or decoded, with the error
+        self.unavailable = {}
+
+    def __missing__(self, name):
+        if name not in self.paths:
+            raise KeyError(name)
+        self.load([name])
+        if not dict.__contains__(self, name):
+            # Unavailable: its file can't be read or decoded
+            raise KeyError(name)
+        return dict.__getitem__(self, name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def missing(self, names):
+        """Return the configured samples among names that are not loaded yet."""
+        return [name for name in dict.fromkeys(names)
+                if name in self.paths and name not in self.unavailable and not dict.__contains__(self, name)]
+
+    def load(self, names):
+        """
+        Load the given samples now, skipping those already loaded.
+
+        A sample whose file can't be read or decoded is logged and left out
+        (see `unavailable`), so looking it up gives the default like an
+        unknown name does, instead of failing in the middle of a song.
+
+        Args:
+            names: Sample names; names without a configured path are ignored
+        """
+        with self.lock:
+            missing = self.missing(names)
+            if missing:
+                built_from = self._read_metadata(missing)
+                rest = self._store_shared(list(built_from))
+                if rest:
+                    self.store(self._load_readable(self.loader, rest))
+                self.built_from.update((name, metadata) for name, metadata in built_from.items()
+                                       if name not in self.unavailable)
+
+    def _read_metadata(self, names):
+        """Return the metadata of names by name, leaving out (as unavailable) samples whose file can't be read."""
+        built_from = {}
+        for name in names:
+            try:
+                built_from[name] = self.metadata(name)
+            except OSError as e:
+                self._set_unavailable(name, e)
+        return built_from
+
+    def _load_readable(self, loader, names):
+        """Run a loader on names, one at a time if the batch fails, leaving out unreadable samples."""
+        try:
+            return loader(names)
+        except (OSError, pygame.error) as e:
+            if len(names) == 1:
+                self._set_unavailable(names[0], e)
+                return {}
+
+        sounds = {}
+        for name in names:
+            sounds.update(self._load_readable(loader, [name]))
+        return sounds
+
+    def _set_unavailable(self, name, error):
+        self.unavailable[name] = error
+        log.error(f"Sample {name} can't be loaded from {self.paths[name]}: {error}")
+
+    def load_drafts(self, names):
+        """
+        Load the given samples quickly, skipping those already loaded.
+
+        Samples with a full-quality version in the packed bank or the cache
+        are taken from there; the others are processed by their draft chain
+        (or not at all, for categories without one) and marked as drafts.
+
+        Args:
+            names: Sample names; names without a configured path are ignored
+
+        Returns:
+            list: Names loaded as drafts
+        """
+        with self.lock:
+            missing = self.missing(names)
+            if not missing:
+                return []
+
+            built_from = self._read_metadata(missing)
+            rest = self._store_shared(list(built_from))
+            sounds = self._load_readable(lambda batch: self.loader(batch, cached_only=True), rest) if rest else {}
+            self.store(sounds)
+            self.built_from.update((name, metadata) for name, metadata in built_from.items()
+                                   if name not in self.unavailable and (name not in rest or name in sounds))
+
+            drafts = [name for name in rest if name not in sounds and name not in self.unavailable]
+            if drafts:
+                sounds = self._load_readable(self.draft_loader, drafts)
+                self.store(sounds, draft=True)
+                drafts = [name for name in drafts if name in sounds]
+                self.drafts.update(dict.fromkeys(drafts))
+            return drafts
+
+    def upgrade(self):
+        """
+        Replace every draft sample with its full-quality version.
+
+        Samples are processed one at a time and each one replaces its draft
+        as soon as it is ready, so lookups (and loads from other threads)
+        never wait for more than a single sample. A sample whose file can't
+        be read or decoded any more keeps its draft, and the others are
+        upgraded all the same.
+        """
+        upgraded = 0
+        while True:
+            with self.lock:
+                if not self.drafts:
+                    break
+                name = next(iter(self.drafts))
+                del self.drafts[name]
+                try:
+                    built_from = self.metadata(name)
+                    if self._store_shared([name]):
+                        self.store(self.loader([name]))
+                except (OSError, pygame.error) as e:
+                    log.error(f"Sample {name} stays a draft, it can't be loaded from {self.paths[name]}: {e}")
+                    continue
+                self.built_from[name] = built_from
+            upgraded += 1
+
+        if upgraded:
+            log.info(f"Upgraded {upgraded} draft samples to full quality")
+
+    def store(self, sounds, onsets=None, draft=False):
+        """
+        Put loaded samples into the bank, trimming them if the bank has a trimmer.
+
+        A sample whose content is already in the bank under another name
+        takes the Sound stored there instead.
+
+        Args:
+            sounds (dict): Sound objects by name
+            onsets (dict): Known onsets of already trimmed sounds, by name
+            draft (bool): Whether the sounds are drafts, which are never shared
+        """
+        for name, sound in sounds.items():
+            if not draft and not self._store_shared([name]):
+                # Took the Sound of a sample with the same content
+                continue
+            if onsets is not None and name in onsets:
+                self.onsets[name] = onsets[name]
+            elif self.trimmer is not None:
+                sound, self.onsets[name] = self.trimmer.trim_sound(sound)
+            dict.__setitem__(self, name, sound)
+            if not draft and self.content_key is not None:
+                self.by_content.setdefault(self.content_key(name), name)
+
+    def _store_shared(self, names):
+        """Store the samples whose content is loaded under another name, returning the other names."""
+        if self.content_key is None:
+            return list(names)
+
+        rest = []
+        for name in names:
+            shared = self.by_content.get(self.content_key(name))
+            if shared is None or shared == name:
+                rest.append(name)
+                continue
+            dict.__setitem__(self, name, dict.__getitem__(self, shared))
+            if shared in self.onsets:
+                self.onsets[name] = self.onsets[shared]
+        return rest
+
+    def memory_report(self):
+        """
+        Report how much memory the loaded samples take.
+
+        A Sound shared by several samples is listed under each of them, but
+        counted once in the category and total figures.
+
+        Returns:
+            dict: 'samples' (bytes by name), 'categories' (bytes by chain name,
+                'unprocessed' for samples without one) and 'total' (bytes)
+        """
+        samples = {}
+        categories = {}
+        sounds = {}
+        category_sounds = {}
+        for name, sound in list(self.items()):
+            size = sndarray.samples(sound).nbytes
+            samples[name] = size
+            sounds[id(sound)] = size
+
+            category = (self.category(name) if self.category else None) or 'unprocessed'
+            counted = category_sounds.setdefault(category, set())
+            if id(sound) not in counted:
+                counted.add(id(sound))
+                categories[category] = categories.get(category, 0) + size
+
+        return {'samples': samples, 'categories': categories, 'total': sum(sounds.values())}
+
+    def prefetch(self, names):
+        """
+        Load the given samples in a background thread.
+
+        Args:
+            names: Sample names; names without a configured path are ignored
+
+        Returns:
+            threading.Thread: The loading thread, or None if everything is loaded already
+        """
+        missing = self.missing(names)
+        if not missing:
+            return None
+
+        thread = threading.Thread(target=self.load, args=(missing,), daemon=True)
+        thread.start()
+        return thread
+
+    def pack(self, bank_path):
+        """
+        Load every configured sample and write them all into a packed bank file.
+
+        Samples that can't be loaded (see `unavailable`) are left out of the bank.
+
+        Args:
+            bank_path (str): File to write, see lib.player.packed_bank
+        """
+        self.load(self.paths)
+        self.upgrade()
+        if self.unavailable:
+            log.warning(f"Not packing {len(self.unavailable)} samples that can't be loaded: "
+                        f"{', '.join(sorted(self.unavailable))}")
+
+        names = [name for name in self.paths if dict.__contains__(self, name)]
+        write_packed_bank(bank_path,
+                          {name: dict.__getitem__(self, name) for name in names},
+                          {name: self.metadata(name) for name in names})
+
+
+def sample_names_for_keys(key_classes):
+    """
+    List the samples that narratives in the given keys can play.
+
+    Args:
+        key_classes: Keys classes (e.g. Keys.CMajor)
+
+    Returns:
+        set: Chord, note and drum sample names
+    """
+    names = set(DRUM_SAMPLES)
+    for key_class in key_classes:
+        key = key_class()
+        names.update(key.chords)
+        names.update(key.notes)
+        # The melody also picks the notes of the current chord
+        for chord in key.chords:
+            names.update(Keys.get_notes_from_chord(chord))
+    return names
+
+
 def load_samples(sample_path,
-                 compressor: Compressor = Compressor(threshold_db=-15),
-                 note_compressor: Compressor = Compressor(makeup_gain_db=0.8),
-                 slide_note_compressor=Compressor(makeup_gain_db=0.6, attack_ms=50),
-                 chord_eq=Equalizer(center_frequency=187, gain_db=20),
-                 chords_limiter=FastLimiter(threshold_db=-5),
-                 bass_eq=Equalizer(center_frequency=170, gain_db=-15),
-                 bass_compressor=MultibandCompressor(high_threshold_db=-40, mid_threshold_db=-40, low_threshold_db=-40,
-                                                     low_ratio=1.0, mid_ratio=2.0),
-                 drums_compressor=Compressor(threshold_db=-25, makeup_gain_db=0.8),
-                 bass_limiter=FastLimiter(threshold_db=-45.0),
-                 bass_filter=FilterPresets.treble_cut(),
-                 force_reload=False):
+                 chain_config=None,
+                 force_reload=False,
+                 processing_dtype=None,
+                 cache_dir=DEFAULT_CACHE_DIR,
+                 workers=None,
+                 keys=None,
+                 lazy=False,
+                 bank_path=None,
+                 draft=False):
     """
     Loads sample from a dictionary of 'note_name': 'file_path'.
     In a real scenario, this would load the actual audio data into memory.
+
+    Args:
+        sample_path (str): Sample config, sample names to WAV files
+        chain_config (str): Chain config, sample_chains.json next to the sample config by default
+        force_reload (bool): Load again even if samples are loaded already
+        processing_dtype: Float type the plugins work in, None to keep the current one
+        cache_dir (str): Cache of processed samples, None to disable it
+        workers (int): Processes used to prepare uncached samples, None for in-process
+        keys (list): Keys classes; only their samples are loaded up front
+        lazy (bool): Load nothing up front, each sample when first looked up
+        bank_path (str): Packed bank file to take the processed samples from
+        draft (bool): Start with samples processed by the draft chains and
+            upgrade them in the background
+
+    Returns:
+        SampleBank: The samples by name
     """
 
     global SAMPLES
 
     if not force_reload:
-        if SAMPLES:
+        if SAMPLES is not None:
             return SAMPLES
 
+    if processing_dtype is not None:
+        set_processing_dtype(processing_dtype)
+
+    samples = _create_bank(sample_path, chain_config, cache_dir, workers, bank_path)
+    paths = samples.paths
+    if not lazy:
+        wanted = paths if keys is None else sample_names_for_keys(keys)
+        wanted = [name for name in paths if name in wanted]
+        if draft:
+            samples.load_drafts(wanted)
+            threading.Thread(target=samples.upgrade, daemon=True).start()
+        else:
+            samples.load(wanted)
+
+    SAMPLES = samples
+    log.info(f"Loading Samples finished ({len(samples)} of {len(paths)} loaded, "
+             f"{samples.memory_report()['total'] / 2 ** 20:.1f} MiB)")
+    return samples
+
+
+def reload_samples(samples, sample_path, chain_config=None, cache_dir=DEFAULT_CACHE_DIR, workers=None,
+                   bank_path=None):
+    """
+    Build a new sample bank from the current configs, reusing what didn't change.
+
+    Loaded samples whose source file and chain settings are unchanged are
+    carried over as they are. Changed ones, and samples new to the config,
+    are processed again; removed ones are dropped. The given bank is left
+    untouched, so it keeps playing until the caller swaps in the result.
+
+    Args:
+        samples (SampleBank): Bank currently in use
+        sample_path (str): Sample config, see `load_samples`
+        chain_config (str): Chain config, see `load_samples`
+        cache_dir (str): Processed sample cache, see `load_samples`
+        workers (int): Worker processes, see `load_samples`
+        bank_path (str): Packed bank file, see `load_samples`
+
+    Returns:
+        tuple: The new SampleBank and a dict listing the 'changed', 'added' and 'removed' names
+    """
+    global SAMPLES
+
+    with samples.lock:
+        loaded = dict(samples)
+        built_from = dict(samples.built_from)
+        onsets = dict(samples.onsets)
+
+    bank = _create_bank(sample_path, chain_config, cache_dir, workers, bank_path)
+
+    changed = []
+    for name, sound in loaded.items():
+        if name not in bank.paths:
+            continue
+        metadata = bank.metadata(name)
+        if built_from.get(name) == metadata:
+            bank.store({name: sound}, onsets)
+            bank.built_from[name] = metadata
+        else:
+            changed.append(name)
+
+    added = [name for name in bank.paths if name not in samples.paths]
+    removed = [name for name in samples.paths if name not in bank.paths]
+
+    # Everything the old bank could play right away, the new one can too,
+    # so swapping banks never makes a lookup load a sample mid-song
+    bank.load(changed + added)
+
+    SAMPLES = bank
+    return bank, {'changed': changed, 'added': added, 'removed': removed}
+
+
+def _create_bank(sample_path, chain_config, cache_dir, workers, bank_path):
+    """
+    Read the sample and chain configs and build an empty SampleBank for them.
+
+    In the chain config, "chains" maps a chain name to its plugin stages and
+    "categories" picks the chain of a sample by the first matching name
+    suffix; samples matching none are loaded as they are. The optional
+    "draft_chains" and "trim" sections hold the cheap chains used with
+    draft=True and the TrimPlugin settings.
+    """
+    if chain_config is None:
+        chain_config = os.path.join(os.path.dirname(sample_path), CHAIN_CONFIG_NAME)
+    with open(chain_config, 'r') as chains_json:
+        chain_settings = json.load(chains_json)
+
+    # Every category runs its stages as one compiled chain: a single
+    # int16 -> float conversion in, a single Sound out
+    chains = compile_chains(chain_settings['chains'])
+    categories = [(category['suffix'], category['chain']) for category in chain_settings['categories']]
+    draft_chains = compile_chains(chain_settings.get('draft_chains', {}))
+    trimmer = TrimPlugin(**chain_settings['trim']) if 'trim' in chain_settings else None
+
+    cache = SampleCache(cache_dir) if cache_dir else None
+
     with open(sample_path, 'r') as samples_json:
-        samples = json.load(samples_json)
+        paths = json.load(samples_json)
+    chain_names = {name: _chain_name(name, categories) for name in paths}
+
+    # Pitches the keys play without a sample of their own are made from
+    # the nearest configured pitch, resampled at the start of its chain
+    for name, (source, semitones) in plan_synthesis(paths, sample_names_for_keys(_all_key_classes())).items():
+        paths[name] = paths[source]
+        chain_names[name] = chain_names[source]
+        if semitones:
+            chain_names[name] = _pitched_chain(chains, draft_chains, chain_names[source], semitones)
+
+    packed = _open_packed_bank(bank_path) if bank_path else None
+
+    # Source file digests, recomputed only when a file changes
+    digests = {}
+
+    def source_digest(path):
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in digests:
+            digests[key] = file_digest(path)
+        return digests[key]
+
+    def category(name):
+        return _chain_name(name, categories)
+
+    def content_key(name):
+        chain_name = chain_names[name]
+        return source_digest(paths[name]), id(chains[chain_name]) if chain_name else None
+
+    def metadata(name):
+        chain_name = chain_names[name]
+        return entry_metadata(paths[name], chains[chain_name] if chain_name else None, trimmer)
+
+    def loader(names, cached_only=False):
+        sounds = packed.sounds(names, metadata) if packed else {}
+        rest = [name for name in names if name not in sounds]
+        if rest:
+            sounds.update(_load_entries({name: paths[name] for name in rest}, chains, chain_names, cache,
+                                        workers, source_digest, cached_only))
+        return sounds
+
+    def draft_loader(names):
+        sounds = {}
+        for name in names:
+            chain = draft_chains.get(chain_names[name])
+            sounds[name] = _process_sample(paths[name], chain) if chain else pygame.mixer.Sound(paths[name])
+        return sounds
+
+    return SampleBank(paths, loader, metadata, draft_loader, trimmer, content_key, category)
+
+
+def _open_packed_bank(bank_path):
+    """Open a packed bank file, None if there is no usable one."""
+    if not os.path.exists(bank_path):
+        log.info(f"No packed bank at {bank_path}, samples are loaded from their files")
+        return None
+    try:
+        packed = PackedBank(bank_path)
+    except (OSError, ValueError) as e:
+        log.warning(f"Ignoring packed bank {bank_path}: {e}")
+        return None
+    if not packed.is_compatible():
+        log.warning(f"Ignoring packed bank {bank_path}: built for a different mixer format or dtype")
+        return None
+    return packed
+
+
+def _load_entries(paths, chains, chain_names, cache, workers, source_digest, cached_only=False):
+    """
+    Load and process samples, returning {name: Sound} in the order of paths.
+
+    chain_names gives the name of the chain in chains each sample goes
+    through, None for unprocessed samples.
+    source_digest is a callable returning the content digest of a file.
+    With cached_only, samples that would need processing are left out.
+    """
+    samples = dict(paths)
+
+    # The same audio through the same (possibly shared) chain is processed
+    # once, even when it is stored in several files
+    groups = {}
+    for name, path in paths.items():
+        chain_name = chain_names[name]
+        content = (source_digest(path), id(chains[chain_name]) if chain_name else None)
+        groups.setdefault(content, (path, chain_name, []))[2].append(name)
+
     # print("Loading sample...")
-    for name, path in samples.items():
-        sound = pygame.mixer.Sound(path)
-        if name.endswith("_note"):
-            if name.endswith("_slide_note"):
-                sound = slide_note_compressor.process_sound(sound)
-            else:
-                sound = note_compressor.process_sound(sound)
-        elif name.endswith("_chord"):  # chords
-            if chord_eq:
-                sound = chord_eq.process_sound(sound)
-            sound = compressor.process_sound(sound)
-            sound = chords_limiter.process_sound(sound)
-        elif name.endswith('_bass'):
-            sound = bass_eq.process_sound(sound)
-            sound = bass_filter.process_sound(sound)
-            sound = bass_compressor.process_sound(sound)
-            sound = bass_limiter.process_sound(sound)
-        elif name.endswith('HiHat'):
-            sound = drums_compressor.process_sound(sound)
-
-        samples[name] = sound
+    pending = []
+    for (digest, _), (path, chain_name, names) in groups.items():
+        if chain_name is None:
+            sound = pygame.mixer.Sound(path)
+            samples.update((name, sound) for name in names)
+            continue
+
+        key = None
+        if cache is not None:
+            key = cache.key(path, chains[chain_name], digest)
+            cached = cache.load(key)
+            if cached is not None:
+                sound = sndarray.make_sound(cached)
+                samples.update((name, sound) for name in names)
+                continue
+
+        pending.append((names, path, chain_name, key))
+
+    if cached_only:
+        for names, _, _, _ in pending:
+            for name in names:
+                del samples[name]
+        return samples
+
+    if workers and len(pending) > 1:
+        sounds = _process_parallel(pending, chains, workers)
+    else:
+        sounds = (_process_sample(path, chains[chain_name]) for _, path, chain_name, _ in pending)
+
+    for (names, _, _, key), sound in zip(pending, sounds):
+        samples.update((name, sound) for name in names)
+        if cache is not None:
+            cache.store(key, sndarray.array(sound))
 
-    SAMPLES = samples
-    log.info("Loading Samples finished")
     return samples
+
+
+def _chain_name(name, categories):
+    """Pick the plugin chain for a sample name, None for unprocessed samples."""
+    for suffix, chain_name in categories:
+        if name.endswith(suffix):
+            return chain_name
+    return None
+
+
+def _pitched_chain(chains, draft_chains, chain_name, semitones):
+    """
+    Add the chains of a category with a pitch shift in front.
+
+    Args:
+        chains (dict): Full-quality chains by name, extended in place
+        draft_chains (dict): Draft chains by name, extended in place
+        chain_name (str): Chain of the category, None for unprocessed samples
+        semitones (int): Pitch shift
+
+    Returns:
+        str: Name of the pitched chain
+    """
+    pitched_name = f"{chain_name or 'unprocessed'}{semitones:+d}"
+    if pitched_name not in chains:
+        shift = PitchShiftPlugin(semitones)
+        chains[pitched_name] = compile_chain([shift] + (chains[chain_name].plugins if chain_name else []))
+        draft_stages = draft_chains[chain_name].plugins if chain_name in draft_chains else []
+        draft_chains[pitched_name] = compile_chain([shift] + draft_stages)
+    return pitched_name
+
+
+def _all_key_classes():
+    """Return every key class defined in Keys."""
+    return [getattr(Keys, name) for name in dir(Keys)
+            if not name.startswith('__') and isinstance(getattr(Keys, name), type)]
+
+
+def _process_sample(path, chain):
+    """Load a sample and run it through its chain."""
+    # Each sample starts from a clean chain, so the result doesn't depend on
+    # which samples were processed before it (and cached entries stay valid)
+    chain.reset_state()
+    return chain.process_sound(pygame.mixer.Sound(path))
+
+
+def _process_parallel(pending, chains, workers):
+    """Process pending samples in a pool of worker processes."""
+    # Spawned workers start from a fresh interpreter instead of a fork of
+    # this one with its SDL audio state
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(pygame.mixer.get_init(), get_processing_dtype().name, chains)) as pool:
+        buffers = pool.map(_process_in_worker, [path for _, path, _, _ in pending],
+                           [chain_name for _, _, chain_name, _ in pending])
+        return [pygame.mixer.Sound(buffer=buffer) for buffer in buffers]
+
+
+def _init_worker(mixer_init, processing_dtype, chains):
+    """Set up a worker process with the same mixer format and plugins as the parent."""
+    global _WORKER_CHAINS
+
+    # Workers never play anything, they only need the mixer to decode samples
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    frequency, size, channels = mixer_init
+    pygame.mixer.init(frequency=frequency, size=size, channels=channels)
+
+    set_processing_dtype(processing_dtype)
+    _WORKER_CHAINS = chains
+
+
+def _process_in_worker(path, chain_name):
+    """Process one sample in a worker and return its raw int16 buffer."""
+    return _process_sample(path, _WORKER_CHAINS[chain_name]).get_raw()
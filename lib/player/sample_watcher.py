@@ -0,0 +1,105 @@
+import os
+import threading
+
+from lib.log import Logger
+from lib.player.sample_cache import DEFAULT_CACHE_DIR
+from lib.player.sample_loader import CHAIN_CONFIG_NAME, reload_samples
+
+# Seconds between two checks of the config files
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+class SampleWatcher:
+    """
+    Background thread reloading the samples of a player when their configs change.
+
+    The sample config and the chain config are polled for changes. On a
+    change only the affected samples are processed again, in the watcher
+    thread, into a new SampleBank; the player keeps playing from its current
+    bank meanwhile. The new bank then replaces `player.samples` in a single
+    assignment, which the playback loop picks up at its next event.
+    """
+
+    def __init__(self, player, sample_path, chain_config=None, cache_dir=DEFAULT_CACHE_DIR, workers=None,
+                 bank_path=None, interval=DEFAULT_POLL_INTERVAL):
+        """
+        Initialize the watcher.
+
+        Args:
+            player: Player whose `samples` are replaced on a change
+            sample_path (str): Sample config the player's samples were loaded from
+            chain_config (str): Chain config, by default sample_chains.json next to the sample config
+            cache_dir (str): Processed sample cache directory, None to disable it
+            workers (int): Processes used to prepare changed samples (None for in-process)
+            bank_path (str): Packed bank file to take unchanged processed samples from
+            interval (float): Seconds between two checks of the config files
+        """
+        self.player = player
+        self.sample_path = sample_path
+        self.chain_config = chain_config or os.path.join(os.path.dirname(sample_path), CHAIN_CONFIG_NAME)
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.bank_path = bank_path
+        self.interval = interval
+
+        self.log = Logger.get_log(self.__class__.__name__)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.config_state = self._config_state()
+
+    def start(self):
+        """Start watching in a daemon thread."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop watching and wait for the thread to finish."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def check(self):
+        """
+        Reload the samples if a config file changed since the last check.
+
+        Returns:
+            bool: True if the player got a new sample bank
+        """
+        config_state = self._config_state()
+        if config_state == self.config_state:
+            return False
+
+        try:
+            samples, changes = reload_samples(self.player.samples, self.sample_path, chain_config=self.chain_config,
+                                              cache_dir=self.cache_dir, workers=self.workers,
+                                              bank_path=self.bank_path)
+        except Exception as e:
+            # Most likely a config saved halfway; keep playing the current
+            # samples and retry when the files change again
+            self.log.warning(f"Could not reload samples: {e}")
+            self.config_state = config_state
+            return False
+
+        self.player.samples = samples
+        self.config_state = config_state
+        self.log.info(f"Reloaded samples: {len(changes['changed'])} changed, {len(changes['added'])} added, "
+                      f"{len(changes['removed'])} removed")
+        return True
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def _config_state(self):
+        """Modification time and size of each config file, None for a missing file."""
+        state = []
+        for path in (self.sample_path, self.chain_config):
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append(None)
+        return state
@@ -0,0 +1,159 @@
+import time
+
+from lib.log import Logger
+from lib.player.transport import Transport
+
+# Nanoseconds before an event the scheduler stops sleeping and spins instead;
+# a sleep can overshoot by a fraction of a millisecond, a spin cannot
+DEFAULT_SPIN_NS = 1_500_000
+
+# Late events: played anyway, or dropped when later than the late threshold
+LATE_PLAY = 'play'
+LATE_DROP = 'drop'
+LATE_POLICIES = (LATE_PLAY, LATE_DROP)
+
+# Milliseconds after its time an event counts as late
+DEFAULT_LATE_THRESHOLD_MS = 30.0
+
+
+class EventScheduler:
+    """
+    Fires timed events on `time.perf_counter_ns`.
+
+    The playing thread sleeps until shortly before each event and spins for
+    the rest, so events fire within microseconds of their time instead of on
+    the next millisecond tick. Every time is absolute from the start of the
+    song, so a late event doesn't delay the ones after it; the lateness of
+    each event is recorded as drift, and events later than the threshold
+    are played or dropped according to the late policy.
+    """
+
+    def __init__(self, late_policy=LATE_PLAY, late_threshold_ms=DEFAULT_LATE_THRESHOLD_MS,
+                 spin_ns=DEFAULT_SPIN_NS, name="Scheduler"):
+        """
+        Initialize the scheduler.
+
+        Args:
+            late_policy (str): LATE_PLAY or LATE_DROP
+            late_threshold_ms (float): Lateness from which the late policy applies
+            spin_ns (int): Nanoseconds spun before each event rather than slept
+            name (str): Name of the scheduler's log
+
+        Raises:
+            ValueError: If the late policy is unknown
+        """
+        if late_policy not in LATE_POLICIES:
+            raise ValueError(f"Unknown late event policy {late_policy!r}, expected one of {LATE_POLICIES}")
+
+        self.late_policy = late_policy
+        self.late_threshold_ns = int(late_threshold_ms * 1_000_000)
+        self.spin_ns = spin_ns
+        self.name = name
+        self.stats = _new_stats()
+
+        self.log = Logger.get_log(name)
+
+    def run(self, events, fire, end_ns=None, transport=None, prepare=None):
+        """
+        Fire events from the calling thread, blocking until they are done.
+
+        While the transport is paused no event fires, and the remaining events
+        (and the end) are pushed back by the length of the pause.
+
+        Args:
+            events: (perf_counter_ns time, payload) pairs in time order
+            fire: Called with the (prepared) payload of each event when its time comes,
+                while the transport's condition is held; it should be quick
+            end_ns (int): perf_counter_ns time to wait for after the last event
+            transport (Transport): Pauses, skips and stops the run
+            prepare: Called with the payload of each event shortly before its time,
+                without holding the condition, and fire gets what it returns;
+                anything slow (e.g. loading a sample) belongs here
+
+        Returns:
+            bool: True if every event was fired (or dropped as late) and the end reached,
+                False if the run was skipped or stopped
+        """
+        transport = transport or Transport()
+        self.stats = stats = _new_stats()
+        # Time spent paused so far, which every later event is pushed back by
+        self._paused_ns = 0
+
+        for time_ns, payload in events:
+            if self._wait_until(time_ns, transport, payload, prepare, fire) is None:
+                return False
+
+        if end_ns is not None and self._wait_until(end_ns, transport) is None:
+            return False
+
+        if stats['fired']:
+            self.log.info(f"Fired {stats['fired']} events, {stats['late']} late, {stats['dropped']} dropped; "
+                          f"mean drift {stats['drift_ns'] / stats['fired'] / 1e6:.3f} ms, "
+                          f"max {stats['max_late_ns'] / 1e6:.3f} ms")
+        return True
+
+    def _fire(self, payload, fire, late_ns):
+        """Fire one event, or drop it if it is too late and the policy says so."""
+        stats = self.stats
+        if late_ns > self.late_threshold_ns:
+            stats['late'] += 1
+            if self.late_policy == LATE_DROP:
+                stats['dropped'] += 1
+                return
+
+        fire(payload)
+        stats['fired'] += 1
+        stats['drift_ns'] += late_ns
+        stats['max_late_ns'] = max(stats['max_late_ns'], late_ns)
+
+    def _wait_until(self, time_ns, transport, payload=None, prepare=None, fire=None):
+        """
+        Wait until `time_ns` (plus the time paused), then fire the event, if any.
+
+        The wait sleeps on the transport's condition, so a pause, skip or stop
+        wakes it at once; the last stretch is spun. The payload is prepared
+        right before the spin without holding the condition, so a slow
+        preparation never holds up a pause, skip or stop; the event is fired
+        while holding it, so nothing can pause the transport in between.
+
+        Returns:
+            int: Nanoseconds late, or None if the run was skipped or stopped
+        """
+        while True:
+            with transport.condition:
+                while True:
+                    if transport.interrupted:
+                        return None
+                    if transport.paused:
+                        paused_at = time.perf_counter_ns()
+                        if not transport.wait_while_paused():
+                            return None
+                        self._paused_ns += time.perf_counter_ns() - paused_at
+                        continue
+
+                    remaining_ns = time_ns + self._paused_ns - time.perf_counter_ns()
+                    if remaining_ns <= self.spin_ns:
+                        break
+                    transport.wait((remaining_ns - self.spin_ns) / 1e9)
+
+            if prepare is not None:
+                payload = prepare(payload)
+                # Prepared once, even if a pause sends the event back to waiting
+                prepare = None
+
+            while time.perf_counter_ns() < time_ns + self._paused_ns:
+                pass
+
+            with transport.condition:
+                # Paused, skipped or stopped while spinning: back to waiting
+                if transport.paused or transport.interrupted:
+                    continue
+                late_ns = time.perf_counter_ns() - time_ns - self._paused_ns
+                if fire is not None:
+                    self._fire(payload, fire, late_ns)
+                return late_ns
+
+
+def _new_stats():
+    """Counters of one run: events fired, late and dropped, total and largest lateness."""
+    return {'fired': 0, 'late': 0, 'dropped': 0, 'drift_ns': 0, 'max_late_ns': 0}
@@ -0,0 +1,140 @@
+import queue
+import threading
+
+import pygame.sndarray as sndarray
+
+from lib.log import Logger
+from lib.player.transport import Transport
+
+# Bars rendered ahead of the one playing
+DEFAULT_BARS_AHEAD = 2
+
+# Seconds between two checks of the output channel
+POLL_INTERVAL = 0.005
+
+log = Logger.get_log("StreamPlayback")
+
+
+class StreamPlayback:
+    """
+    Plays a narrative as a stream of pre-mixed blocks on a single channel.
+
+    A background thread renders the song one bar at a time with an
+    OfflineRenderer into a bounded queue, a few bars ahead of the playhead.
+    The playing thread hands each block to the channel's one-slot queue as
+    soon as it frees up, and the mixer starts the queued block on the frame
+    the previous one ends. Timing is therefore sample accurate, and memory
+    stays at a few bars whatever the length of the song.
+    """
+
+    def __init__(self, renderer, channel, bars_ahead=DEFAULT_BARS_AHEAD):
+        """
+        Initialize the playback.
+
+        Args:
+            renderer (OfflineRenderer): Renders the blocks
+            channel (pygame.mixer.Channel): The channel every block is played on
+            bars_ahead (int): Blocks rendered ahead of the one playing
+        """
+        self.renderer = renderer
+        self.channel = channel
+        self.bars_ahead = bars_ahead
+
+    def play(self, narrative_data, transport=None):
+        """
+        Play a narrative, blocking until it has finished.
+
+        Args:
+            narrative_data: A list of Bar objects, or a CompiledNarrative
+            transport (Transport): Skipping or stopping it stops playback at once;
+                while it is paused no block is handed to the channel
+
+        Returns:
+            bool: True if the narrative played to the end, False if it was
+                stopped or failed to render
+        """
+        transport = transport or Transport()
+        blocks = queue.Queue(maxsize=self.bars_ahead)
+        stopped = threading.Event()
+        errors = []
+
+        producer = threading.Thread(target=self._render, args=(narrative_data, blocks, stopped, errors),
+                                    daemon=True)
+        producer.start()
+        try:
+            while True:
+                block = self._next_block(blocks, transport)
+                if block is None:
+                    break
+
+                # The channel plays one block and holds the next; wait for the slot
+                if not self._wait(transport, lambda: self.channel.get_queue() is not None):
+                    return self._stop(stopped)
+                self.channel.queue(sndarray.make_sound(block))
+
+            if errors:
+                log.error(f"Rendering the song failed, stopping it: {errors[0]}", exc_info=errors[0])
+                return self._stop(stopped)
+
+            if not self._wait(transport, self.channel.get_busy):
+                return self._stop(stopped)
+            return True
+        finally:
+            stopped.set()
+            producer.join()
+
+    def _render(self, narrative_data, blocks, stopped, errors):
+        """Producer thread: render the song into the block queue, ending with None even if rendering fails."""
+        try:
+            for block in self.renderer.render_blocks(narrative_data, self.renderer.frames_per_bar()):
+                if not self._put(blocks, block, stopped):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            self._put(blocks, None, stopped)
+
+    @staticmethod
+    def _put(blocks, block, stopped):
+        """Put a block on the queue once there is room, False if playback stopped first."""
+        while not stopped.is_set():
+            try:
+                blocks.put(block, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _next_block(blocks, transport):
+        """Take the next block off the queue, None at the end of the song or when stopped."""
+        while not transport.interrupted:
+            try:
+                return blocks.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
+
+    @staticmethod
+    def _wait(transport, busy):
+        """
+        Wait while `busy()` returns True or the transport is paused.
+
+        The channel can't tell when it frees up, so it is polled; the poll
+        sleeps on the transport, which a skip or stop wakes at once.
+
+        Returns:
+            bool: False if playback was skipped or stopped meanwhile
+        """
+        with transport.condition:
+            while transport.paused or busy():
+                if transport.interrupted:
+                    return False
+                # Nothing to poll while paused: wait for the resume itself
+                transport.wait(None if transport.paused else POLL_INTERVAL)
+            return not transport.interrupted
+
+    def _stop(self, stopped):
+        stopped.set()
+        self.channel.stop()
+        return False
@@ -0,0 +1,76 @@
+import re
+
+# Octave of sample names that don't give one (C_note is C4, C5_note the octave above)
+DEFAULT_OCTAVE = 4
+
+# Kinds of samples whose names tell their pitch
+PITCHED_SUFFIXES = ('_note', '_maj_chord', '_min_chord')
+
+# Largest shift, in semitones, a sample is resampled by
+MAX_SHIFT = 2
+
+_PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+_ACCIDENTALS = {None: 0, 'Sharp': 1, 'Flat': -1}
+_NAME_PATTERN = re.compile(r'^([A-G])(Sharp|Flat)?(\d)?(_.+)$')
+
+
+def sample_pitch(name):
+    """
+    Read the pitch of a sample from its name.
+
+    Args:
+        name (str): Sample name, e.g. "CSharp5_note" or "BFlat_min_chord"
+
+    Returns:
+        tuple: (MIDI note number, kind suffix such as "_note"), or None if
+            the name doesn't tell a pitch
+    """
+    match = _NAME_PATTERN.match(name)
+    if match is None or match.group(4) not in PITCHED_SUFFIXES:
+        return None
+
+    letter, accidental, octave, suffix = match.groups()
+    octave = int(octave) if octave else DEFAULT_OCTAVE
+    return 12 * (octave + 1) + _PITCH_CLASSES[letter] + _ACCIDENTALS[accidental], suffix
+
+
+def plan_synthesis(paths, names, max_shift=MAX_SHIFT):
+    """
+    Pick the sample to make each missing pitched sample from.
+
+    A missing sample is made from the configured sample of the same kind
+    nearest in pitch. An enharmonic spelling of a configured pitch (FFlat
+    for E) is a shift of 0, i.e. the same audio; otherwise the source is
+    resampled. When two sources are equally near, the higher one is shifted
+    down.
+
+    Args:
+        paths (dict): Configured samples by name
+        names: Sample names that should be playable
+        max_shift (int): Largest shift in semitones; farther pitches stay missing
+
+    Returns:
+        dict: (source name, shift in semitones) by missing sample name
+    """
+    sources = {}
+    for name in paths:
+        pitch = sample_pitch(name)
+        if pitch is not None:
+            sources.setdefault(pitch, name)
+
+    plan = {}
+    for name in sorted(names):
+        pitch = sample_pitch(name)
+        if name in paths or pitch is None:
+            continue
+
+        target, suffix = pitch
+        candidates = [(abs(target - source_pitch), target > source_pitch, source_pitch)
+                      for source_pitch, source_suffix in sources if source_suffix == suffix]
+        if not candidates:
+            continue
+
+        distance, _, source_pitch = min(candidates)
+        if distance <= max_shift:
+            plan[name] = (sources[(source_pitch, suffix)], target - source_pitch)
+    return plan
@@ -0,0 +1,82 @@
+import threading
+
+
+class Transport:
+    """
+    Pause, skip and stop state of a player, with waits that any change ends.
+
+    Everything waiting on a transport (the wait for a pause to end, the
+    scheduler between two events, a stream waiting for its channel) waits
+    on its condition, so pausing, skipping or stopping wakes it at once
+    instead of at its next poll. Holding `condition` also keeps the state
+    from changing, e.g. between checking it and playing a sound.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self._paused = False
+        self._skipping = False
+        self._stopped = False
+
+    @property
+    def paused(self):
+        return self._paused
+
+    @property
+    def skipping(self):
+        return self._skipping
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    @property
+    def interrupted(self):
+        """True once the current song is skipped or stopped."""
+        return self._skipping or self._stopped
+
+    def pause(self):
+        self._update(_paused=True)
+
+    def resume(self):
+        self._update(_paused=False)
+
+    def skip(self):
+        self._update(_skipping=True)
+
+    def stop(self):
+        self._update(_stopped=True)
+
+    def clear(self):
+        """Forget a skip or stop once the song it ended is over."""
+        self._update(_skipping=False, _stopped=False)
+
+    def wait(self, timeout=None):
+        """
+        Wait until the state changes or the timeout passes.
+
+        Callers should hold `condition` while checking the state and calling
+        this, so that a change in between isn't missed.
+
+        Args:
+            timeout (float): Seconds to wait at most, None for no limit
+        """
+        with self.condition:
+            self.condition.wait(timeout)
+
+    def wait_while_paused(self):
+        """
+        Block while paused.
+
+        Returns:
+            bool: False if the song was skipped or stopped meanwhile
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not self._paused or self.interrupted)
+            return not self.interrupted
+
+    def _update(self, **state):
+        with self.condition:
+            for name, value in state.items():
+                setattr(self, name, value)
+            self.condition.notify_all()
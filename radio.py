@@ -2,6 +2,8 @@ from lib.log import Logger
 from lib.media.media_info import MediaInfo
 from lib.media.media_provider import MediaProvider
 from lib.player.player import Player
+from lib.player.scheduler import DEFAULT_LATE_THRESHOLD_MS, LATE_DROP, LATE_PLAY
+from lib.player.stream import DEFAULT_BARS_AHEAD
 import argparse
 from server.server import create_app
 
@@ -21,6 +23,24 @@ def main():
     parser.add_argument("--drums", action="store_true", help="Enable drums to be played along with narrative")
     parser.add_argument("--bass", action="store_true", help="Enable bass to be played along with narrative")
     parser.add_argument("--debug", action="store_true", help="Enable debug on flask")
+    parser.add_argument("--sample-workers", type=int, default=None,
+                        help="Number of processes used to prepare the samples on a cold start")
+    parser.add_argument("--lazy-samples", action="store_true",
+                        help="Load each sample when it is first needed instead of at startup")
+    parser.add_argument("--sample-bank", type=str, default=None,
+                        help="Packed sample bank built with 'python -m lib.player.packed_bank'")
+    parser.add_argument("--draft-samples", action="store_true",
+                        help="Start playing with quickly processed samples, upgraded to full quality in the background")
+    parser.add_argument("--stream", action="store_true",
+                        help="Play songs as blocks mixed a few bars ahead instead of sample by sample")
+    parser.add_argument("--bars-ahead", type=int, default=DEFAULT_BARS_AHEAD,
+                        help="Bars mixed ahead of the playhead with --stream")
+    parser.add_argument("--late-events", choices=(LATE_PLAY, LATE_DROP), default=LATE_PLAY,
+                        help="Play events the player woke up too late for, or drop them")
+    parser.add_argument("--late-threshold-ms", type=float, default=DEFAULT_LATE_THRESHOLD_MS,
+                        help="Milliseconds after its time from which an event counts as late")
+    parser.add_argument("--watch-samples", action="store_true",
+                        help="Reload changed samples without a restart when the sample configs are edited")
 
     args = parser.parse_args()
 
@@ -28,7 +48,13 @@ def main():
                                    enable_drums=args.drums, max_queue_length=10)
     media_provider.start_producer_thread()
 
-    player = Player(bpm=args.bpm)
+    player = Player(bpm=args.bpm, sample_workers=args.sample_workers,
+                    keys=media_provider.key_classes, lazy_samples=args.lazy_samples,
+                    sample_bank=args.sample_bank, draft_samples=args.draft_samples,
+                    stream=args.stream, bars_ahead=args.bars_ahead, late_events=args.late_events,
+                    late_threshold_ms=args.late_threshold_ms)
+    if args.watch_samples:
+        player.watch_samples()
 
     radio_stats = {
         'bpm': args.bpm,
@@ -47,10 +73,16 @@ def main():
             # keep running the cycle of repeating narratives
             while True:
                 media_info: MediaInfo = media_provider.get_next_media_info()
+
+                # Load what the following narrative needs while this one plays
+                upcoming: MediaInfo = media_provider.peek_next_media_info()
+                if upcoming is not None:
+                    player.prefetch_samples(upcoming.narrative_data)
+
                 metadata = {'key': media_info.musical_key}
                 for _ in range(args.repeat):
                     # this is a thread blocking call
-                    player.play_music(narrative_data=media_info.narrative_data,
+                    player.play_music(narrative_data=media_info.compiled_narrative,
                                       signature_key=media_info.signature_key,
                                       metadata=metadata)
 
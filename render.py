@@ -0,0 +1,46 @@
+import argparse
+import os
+
+import pygame
+
+from lib.generator.arrangement import ArrangementGenerator
+from lib.log import Logger
+from lib.media.media_provider import get_keys
+from lib.player.renderer import OfflineRenderer
+from lib.player.sample_loader import load_samples
+
+log = Logger.get_log("Render")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate music and render it to WAV files.")
+    parser.add_argument("--bars", type=int, default=8, help="The number of bars in the generated song.")
+    parser.add_argument("--bpm", type=int, default=124, help="The tempo of the music in beats per minute.")
+    parser.add_argument("--narratives", type=int, default=1, help="Number of narratives to render per key")
+    parser.add_argument("--keys", type=str, default="C,G,E,G", help="Keys that you want to render (in order)")
+    parser.add_argument("--drums", action="store_true", help="Enable drums to be played along with narrative")
+    parser.add_argument("--output", type=str, default="renders", help="Directory to write the WAV files to")
+    parser.add_argument("--sample-bank", type=str, default=None,
+                        help="Packed sample bank built with 'python -m lib.player.packed_bank'")
+
+    args = parser.parse_args()
+
+    # Rendering needs the mixer format, not an audio device
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.mixer.init()
+
+    samples = load_samples("sample_config.json", lazy=True, bank_path=args.sample_bank)
+    renderer = OfflineRenderer(samples, bpm=args.bpm)
+    generator = ArrangementGenerator(config={'enable_drums': args.drums})
+
+    os.makedirs(args.output, exist_ok=True)
+    for index, key_class in enumerate(get_keys(args.keys)):
+        for narrative in range(args.narratives):
+            narrative_data, signature_key = generator.generate(key=key_class(), bars=args.bars)
+            path = os.path.join(args.output, f"{index + 1:02d}_{key_class.__name__}_{narrative + 1}.wav")
+            renderer.write_wav(narrative_data, path)
+            log.info(f"Rendered {len(narrative_data)} bars in {key_class.__name__} to {path}")
+
+
+if __name__ == '__main__':
+    main()